@@ -0,0 +1,87 @@
+"""Compares the fused geolocation kernel of the radar curtain with the gate by gate computation it replaces.
+
+For the gate by gate reference and the kernel in float64 and float32, measures the time to locate every gate
+of a synthetic CRS-like curtain, and the maximum difference with the reference once rounded to float32
+(the precision of the zarr store), in float32 ulps and in degrees/meters.
+
+Usage, from the root of the repository (PYTHONPATH is not needed once the package is installed, e.g. pip install -e .):
+    PYTHONPATH=src python benchmarks/geolocation_benchmark.py --profiles 20000 --gates 500
+"""
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+from fcx_playground.fcx_dataprocess.utils.geolocation import geolocate_gates, to_rad
+
+
+def gate_by_gate(lon, lat, alt, roll, pitch, head, rad_range):
+    # previous implementation: every per profile column repeated over the gates, one sin/cos per gate
+    num_rows, num_cols = lon.size, rad_range.size
+    lon = np.repeat(lon, num_cols)
+    lat = np.repeat(lat, num_cols)
+    alt = np.repeat(alt, num_cols)
+    roll = np.repeat(roll * to_rad, num_cols)
+    pitch = np.repeat(pitch * to_rad, num_cols)
+    head = np.repeat(head * to_rad, num_cols)
+    rad_range = np.tile(rad_range, num_rows)
+    x = np.sin(roll) * np.cos(head) + np.cos(roll) * np.sin(pitch) * np.sin(head)
+    y = -np.sin(roll) * np.sin(head) + np.cos(roll) * np.sin(pitch) * np.cos(head)
+    z = -np.cos(roll) * np.cos(pitch)
+    x = np.multiply(x, np.divide(rad_range, 111000 * np.cos(lat * to_rad)))
+    y = np.multiply(y, np.divide(rad_range, 111000))
+    z = np.multiply(z, rad_range)
+    shape = (num_rows, num_cols)
+    return np.add(-x, lon).reshape(shape), np.add(-y, lat).reshape(shape), np.add(z, alt).reshape(shape)
+
+
+def synthetic_profiles(num_profiles, num_gates, seed=0):
+    rng = np.random.default_rng(seed)
+    return {
+        "lon": -124.0 + np.cumsum(rng.normal(0.002, 0.0002, num_profiles)),
+        "lat": 47.0 + np.cumsum(rng.normal(0.001, 0.0002, num_profiles)),
+        "alt": 19000 + np.cumsum(rng.normal(0, 0.5, num_profiles)),
+        "roll": rng.normal(0, 2, num_profiles),
+        "pitch": rng.normal(2, 1, num_profiles),
+        "head": np.cumsum(rng.normal(0, 0.1, num_profiles)) % 360,
+        "rad_range": np.arange(num_gates) * 26.0
+    }
+
+
+def timed(function, repeat):
+    best = np.inf
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--profiles", type=int, default=20000, help="number of radar profiles")
+    parser.add_argument("--gates", type=int, default=500, help="number of gates per profile")
+    parser.add_argument("--repeat", type=int, default=3, help="number of runs, the best one is reported")
+    args = parser.parse_args()
+
+    profiles = synthetic_profiles(args.profiles, args.gates)
+    num_points = args.profiles * args.gates
+    reference_time, reference = timed(lambda: gate_by_gate(**profiles), args.repeat)
+    reference = [np.asarray(column, dtype=np.float32) for column in reference]
+
+    results = [{"implementation": "gate by gate (float64)", "seconds": reference_time, "points/s": num_points / reference_time}]
+    for dtype in [np.float64, np.float32]:
+        seconds, located = timed(lambda: geolocate_gates(**profiles, dtype=dtype), args.repeat)
+        result = {"implementation": "kernel ({})".format(np.dtype(dtype).name), "seconds": seconds, "points/s": num_points / seconds}
+        for name, column, expected in zip(["lon", "lat", "alt"], located, reference):
+            difference = np.abs(column.astype(np.float32) - expected)
+            result["max {} error".format(name)] = float(np.max(difference))
+            result["max {} ulps".format(name)] = float(np.max(difference / np.spacing(np.abs(expected))))
+        results.append(result)
+    print("{} points".format(num_points))
+    print(pd.DataFrame(results).set_index("implementation").to_string())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+"""Compares the pre-compressed sidecars of the .pnts tiles, per tile encoding, content encoding and level.
+
+Tiles a zarr store (by default a synthetic CRS-like one) with the default and compact tile encodings, and
+for every content encoding and level measures the size of the sidecars relative to the raw tiles and the
+compression throughput.
+
+Usage, from the root of the repository (PYTHONPATH is not needed once the package is installed, e.g. pip install -e .):
+    PYTHONPATH=src python benchmarks/tiles_compress_benchmark.py --profiles 20000 --gates 500
+    PYTHONPATH=src python benchmarks/tiles_compress_benchmark.py --zarr temp/2015-11-10/olympex_CRS_20151110_223000-253000_v01/zarr
+"""
+import argparse
+import os
+import shutil
+import tempfile
+import time
+
+import pandas as pd
+
+from fcx_playground.fcx_dataprocess.tiles_rad_range import RadRangeTilesPointCloudDataProcess
+from fcx_playground.fcx_dataprocess.utils.tiles_compress import brotli, compress_bytes
+from fcx_playground.fcx_dataprocess.utils.tiles_writer import write_tiles
+from zarr_storage_benchmark import synthetic_points
+
+
+def synthetic_store(num_profiles, num_gates, folder):
+    data = synthetic_points(num_profiles, num_gates)
+    data_process = RadRangeTilesPointCloudDataProcess()
+    zarr_path = os.path.join(folder, "zarr")
+    epoch = int(data["time"].values[0])
+    root = data_process._create_zarr_store(zarr_path, data.shape[0])
+    data_process._write_to_zarr(root, data_process._get_zarr_columns(data, epoch), 0)
+    data_process._finalize_zarr(root, epoch)
+    return zarr_path
+
+
+def benchmark(tiles, encoding, content_encoding, level):
+    raw_size = sum(len(tile) for tile in tiles)
+    start = time.perf_counter()
+    compressed_size = sum(len(compress_bytes(tile, content_encoding, level)) for tile in tiles)
+    seconds = time.perf_counter() - start
+    return {
+        "tile encoding": encoding,
+        "content encoding": content_encoding,
+        "level": level,
+        "raw MB": raw_size / 1e6,
+        "compressed MB": compressed_size / 1e6,
+        "compressed / raw": compressed_size / raw_size,
+        "MB/s": raw_size / seconds / 1e6
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--zarr", help="zarr store to tile (default: a synthetic one)")
+    parser.add_argument("--profiles", type=int, default=20000, help="number of radar profiles of the synthetic store")
+    parser.add_argument("--gates", type=int, default=500, help="number of gates per profile of the synthetic store")
+    parser.add_argument("--gzip-levels", type=int, nargs="+", default=[1, 6, 9], help="gzip levels to compare")
+    parser.add_argument("--br-levels", type=int, nargs="+", default=[5, 6, 9], help="brotli qualities to compare, when brotli is installed")
+    args = parser.parse_args()
+
+    folder = tempfile.mkdtemp()
+    try:
+        zarr_path = args.zarr or synthetic_store(args.profiles, args.gates, folder)
+        results = []
+        for encoding in ["default", "compact"]:
+            point_cloud_folder = os.path.join(folder, encoding)
+            write_tiles("ref", 0, 1000000000000, zarr_path, point_cloud_folder, incremental=False, encoding=encoding)
+            tiles = []
+            for filename in sorted(os.listdir(point_cloud_folder)):
+                if filename.endswith(".pnts"):
+                    with open(os.path.join(point_cloud_folder, filename), mode="rb") as infile:
+                        tiles.append(infile.read())
+            for level in args.gzip_levels:
+                results.append(benchmark(tiles, encoding, "gzip", level))
+            if brotli is not None:
+                for level in args.br_levels:
+                    results.append(benchmark(tiles, encoding, "br", level))
+    finally:
+        shutil.rmtree(folder)
+    print(pd.DataFrame(results).set_index(["tile encoding", "content encoding", "level"]).round(3).to_string())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+"""Compares the storage presets of the intermediate zarr store on a synthetic CRS-like dataset.
+
+For every preset, measures:
+    write: throughput of the integration step (points and raw megabytes per second).
+    read: throughput of reading the points of a write_tiles time window (location, value, time).
+    ratio: raw size / size on disk.
+
+Usage, from the root of the repository (PYTHONPATH is not needed once the package is installed, e.g. pip install -e .):
+    PYTHONPATH=src python benchmarks/zarr_storage_benchmark.py --profiles 20000 --gates 500 --window 600
+"""
+import argparse
+import os
+import shutil
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+import zarr
+
+from fcx_playground.fcx_dataprocess.tiles_rad_range import RadRangeTilesPointCloudDataProcess
+from fcx_playground.fcx_dataprocess.utils.manifest import path_size
+from fcx_playground.fcx_dataprocess.utils.zarr_index import TimeIndex
+from fcx_playground.fcx_dataprocess.utils.zarr_storage import storage_presets, read_location
+
+
+def synthetic_points(num_profiles, num_gates, seed=0):
+    """Returns a dataframe of points laid out like a CRS curtain: one profile per second along a flight track,
+    num_gates points below the aircraft per profile, with a noisy reflectivity and some missing gates."""
+    rng = np.random.default_rng(seed)
+    epoch = 1447194600
+    time = np.repeat(epoch + np.arange(num_profiles, dtype=np.int64), num_gates)
+    heading = np.cumsum(rng.normal(0, 0.002, num_profiles))
+    lon = -124.0 + np.cumsum(np.cos(heading) * 0.002)
+    lat = 47.0 + np.cumsum(np.sin(heading) * 0.002)
+    aircraft_alt = 19000 + np.cumsum(rng.normal(0, 0.5, num_profiles))
+    gate_range = np.arange(num_gates) * 26.0
+    alt = (aircraft_alt[:, np.newaxis] - gate_range).ravel()
+    ref = (rng.normal(10, 8, (num_profiles, num_gates)) - gate_range / 1000).ravel()
+    # gates without echo are dropped by the preprocessing
+    keep = rng.random(ref.size) > 0.3
+    return pd.DataFrame({
+        "time": time[keep],
+        "lon": np.repeat(lon, num_gates)[keep],
+        "lat": np.repeat(lat, num_gates)[keep],
+        "alt": alt[keep],
+        "ref": ref[keep]
+    })
+
+
+def benchmark(preset, data, window, folder):
+    data_process = RadRangeTilesPointCloudDataProcess(storage=preset)
+    zarr_path = os.path.join(folder, preset)
+    epoch = int(data["time"].values[0])
+
+    start = time.perf_counter()
+    root = data_process._create_zarr_store(zarr_path, data.shape[0])
+    data_process._write_to_zarr(root, data_process._get_zarr_columns(data, epoch), 0)
+    data_process._finalize_zarr(root, epoch)
+    write_time = time.perf_counter() - start
+
+    # same reads as write_tiles, for a time window in the middle of the flight
+    middle = int(data["time"].values[data.shape[0] // 2])
+    start = time.perf_counter()
+    root = zarr.open_group(zarr_path, mode="r")
+    start_id, end_id = TimeIndex(root).query(middle, middle + window)
+    lon, lat, alt = read_location(root, start_id, end_id)
+    value = root["value"]["ref"][start_id:end_id]
+    window_time = root["time"][start_id:end_id]
+    read_time = time.perf_counter() - start
+
+    # location (3 float32), time (int32) and value (float32) per point
+    raw_size = data.shape[0] * 20
+    columns = [lon, lat, alt, value, window_time]
+    # every column of the window is read in full, in its dtype
+    assert all(column.shape[0] == end_id - start_id for column in columns)
+    num_read = end_id - start_id
+    read_size = sum(column.nbytes for column in columns)
+    return {
+        "preset": preset,
+        "write points/s": data.shape[0] / write_time,
+        "write MB/s": raw_size / write_time / 1e6,
+        "read points/s": num_read / read_time,
+        "read MB/s": read_size / read_time / 1e6,
+        "ratio": raw_size / path_size(zarr_path)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--profiles", type=int, default=20000, help="number of radar profiles (one per second)")
+    parser.add_argument("--gates", type=int, default=500, help="number of gates per profile")
+    parser.add_argument("--window", type=int, default=600, help="duration of the write_tiles window read, in seconds")
+    parser.add_argument("--presets", nargs="+", default=list(storage_presets), help="presets to compare")
+    args = parser.parse_args()
+
+    data = synthetic_points(args.profiles, args.gates)
+    print("{} points".format(data.shape[0]))
+    folder = tempfile.mkdtemp()
+    try:
+        results = [benchmark(preset, data, args.window, folder) for preset in args.presets]
+    finally:
+        shutil.rmtree(folder)
+    print(pd.DataFrame(results).set_index("preset").round(2).to_string())
+
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,15 @@
+import json
+
 from .base_viz import CesiumViz
 
 class CZMLViz(CesiumViz):
-  def add_script(self, czml_path: str) -> str:
+  def add_script(self, czml_path) -> str:
+    # czml_path is either one czml, or the list of czml of a progressive load (see NavCZMLDataProcess.prep_visualization_multires):
+    # the first one is shown right away, the others are then merged into it one by one.
+    if isinstance(czml_path, (list, tuple)):
+      czml_path, detail_czml_paths = czml_path[0], list(czml_path[1:])
+    else:
+      detail_czml_paths = []
     # print('add script that creates cesium viewer and loads it with various kinds of data (czml, 3dtilesets, etc))')
     s1= \
       """
@@ -18,6 +26,7 @@ class CZMLViz(CesiumViz):
       """
     s2 = \
       f"""
+        const detailCzmlPaths = {json.dumps(detail_czml_paths)};
         Cesium.CzmlDataSource.load("{czml_path}")
       """
     s3 = \
@@ -62,6 +71,11 @@ class CZMLViz(CesiumViz):
                   return fixedOrientation;
               }
           }
+
+          // progressively load the detail czml, once the overview is shown
+          for (const detailCzmlPath of detailCzmlPaths) {
+              await dataSource.process(detailCzmlPath);
+          }
         });
       }
       """
@@ -30,6 +30,17 @@ class TilesViz(CesiumViz):
             pointSize: 5.0
           });
 
+        // compact tilesets hold quantized values, decoded with the offset and scale of the tileset extras
+        tileset.readyPromise.then(function (tileset) {
+          const valueEncoding = tileset.extras ? tileset.extras.value : undefined;
+          if (valueEncoding) {
+            tileset.style = new Cesium.Cesium3DTileStyle({
+              color: getColorExpression(valueEncoding),
+              pointSize: 5.0
+            });
+          }
+        });
+
         var currentTime = Cesium.JulianDate.fromIso8601("2015-11-10T17:54:00Z")
         var endTime = Cesium.JulianDate.fromIso8601("2015-11-10T23:59:00Z");
 
@@ -43,7 +54,7 @@ class TilesViz(CesiumViz):
         viewer.zoomTo(tileset);
       }
               
-      function getColorExpression() {
+      function getColorExpression(valueEncoding) {
         // helper to generate color expression,
         //  to style the tileset refer. tilset styling in cesium docs for more info on styling expressions. 
           let reverse = true
@@ -58,7 +69,11 @@ class TilesViz(CesiumViz):
           if (reverse) {
               revScale = " * -1.0 + 1.0"
           }
-          return `hsla((((clamp(\${value}, ${vmin}, ${vmax}) + ${vmin}) / ${vrange}) ${revScale}) * ${hrange} + ${hmin}, 1.0, 0.5, pow((\${value} - ${vmin})/${vrange}, ${ascale}))`
+          let value = "\${value}"
+          if (valueEncoding) {
+              value = `(\${value} * ${valueEncoding.scale} + ${valueEncoding.offset})`
+          }
+          return `hsla((((clamp(${value}, ${vmin}, ${vmax}) + ${vmin}) / ${vrange}) ${revScale}) * ${hrange} + ${hmin}, 1.0, 0.5, pow((${value} - ${vmin})/${vrange}, ${ascale}))`
       }
       """
     return p1 + p2 + p3
\ No newline at end of file
@@ -0,0 +1,104 @@
+import os
+import sys
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+
+from .abstract.data_process import DataProcess
+
+# result of the ingest -> preprocess -> prep_visualization pipeline for one url.
+# preprocessed holds the intermediate file path (e.g. zarr), when the preprocessing step produces one.
+BatchResult = namedtuple("BatchResult", ["url", "preprocessed", "visualization", "error"])
+
+# data process instance owned by each worker process
+_worker_data_process = None
+
+
+def _init_worker(data_process_class: type, kwargs: dict):
+    global _worker_data_process
+    _worker_data_process = data_process_class(**kwargs)
+
+
+def _run_pipeline(url: str) -> BatchResult:
+    url_type = "s3" if url.startswith("s3://") else "local"
+    try:
+        data = _worker_data_process.ingest(url, url_type)
+        preprocessed = _worker_data_process.preprocess(data)
+        visualization = _worker_data_process.prep_visualization(preprocessed)
+    except Exception as e:
+        return BatchResult(url, None, None, repr(e))
+    if not isinstance(preprocessed, str):
+        # in memory intermediate data (e.g. dataframes) are not sent back to the parent process
+        preprocessed = None
+    return BatchResult(url, preprocessed, visualization, None)
+
+
+class BatchDataProcess:
+    """
+    Runs the ingest -> preprocess -> prep_visualization pipeline of a DataProcess
+    over a list of local or S3 urls, in parallel over a pool of worker processes.
+
+    Every worker process creates its own DataProcess instance, so the per file state
+    kept on the instances is never shared between files processed at the same time.
+
+    Args:
+        data_process_class (type): concrete DataProcess class, e.g. NavCZMLDataProcess.
+        max_workers (int): number of worker processes (default: number of cpus).
+        max_pending (int): maximum number of files submitted to the pool at a time,
+            bounds the memory held by queued arguments and results (default: 2 * max_workers).
+        max_tasks_per_child (int): restart worker processes after that many files,
+            releasing any memory they hold on to (default: never). Raises ValueError before python 3.11.
+        **kwargs: keyword arguments used to create the DataProcess instances.
+
+    Example:
+        batch = BatchDataProcess(RadRangeTilesPointCloudDataProcess, max_workers=8, block_size=2000)
+        for result in batch.run(["s3://bucket/olympex_CRS_20151110_....nc", ...]):
+            print(result.url, result.preprocessed, result.visualization, result.error)
+    """
+    def __init__(self, data_process_class: type, max_workers: int = None, max_pending: int = None, max_tasks_per_child: int = None, **kwargs):
+        if not issubclass(data_process_class, DataProcess):
+            raise TypeError("{} is not a DataProcess".format(data_process_class.__name__))
+        self.data_process_class = data_process_class
+        self.kwargs = kwargs
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        if max_tasks_per_child is not None and sys.version_info < (3, 11):
+            # added to ProcessPoolExecutor by python 3.11, the rest of the package runs on 3.8+
+            raise ValueError("max_tasks_per_child needs python 3.11+")
+        self.max_tasks_per_child = max_tasks_per_child
+
+    def run(self, urls: list) -> list:
+        """Returns a list of BatchResult, in the same order as the urls.
+
+        Keyword arguments:
+        urls -- local paths or s3 urls (s3://bucket/key) of the raw data files.
+        """
+        results = [None] * len(urls)
+        for index, result in self.run_iter(urls):
+            results[index] = result
+        return results
+
+    def run_iter(self, urls: list):
+        """Yields (index, BatchResult) tuples as soon as each url is processed."""
+        max_workers = self.max_workers or os.cpu_count() or 1
+        max_pending = self.max_pending or 2 * max_workers
+        with self._create_executor(max_workers) as executor:
+            pending = {}
+            next_index = 0
+            while next_index < len(urls) or pending:
+                while next_index < len(urls) and len(pending) < max_pending:
+                    future = executor.submit(_run_pipeline, urls[next_index])
+                    pending[future] = next_index
+                    next_index += 1
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield pending.pop(future), future.result()
+
+    def _create_executor(self, max_workers: int) -> ProcessPoolExecutor:
+        options = {
+            "max_workers": max_workers,
+            "initializer": _init_worker,
+            "initargs": (self.data_process_class, self.kwargs)
+        }
+        if self.max_tasks_per_child is not None:
+            options["max_tasks_per_child"] = self.max_tasks_per_child
+        return ProcessPoolExecutor(**options)
@@ -1,15 +1,25 @@
-import boto3
-from copy import deepcopy
+import os
 import numpy as np
 import pandas as pd
 from typing import Generator
 
 from .abstract.czml_data_process import CZMLDataProcess
 from .utils.czml_writer_nav import NavCzmlWriter
+from .utils.trajectory import simplify_trajectory
+from .utils.s3_io import get_s3_details, open_s3
+from .utils.s3_cache import S3Cache
 
 class NavCZMLDataProcess(CZMLDataProcess):
-  def __init__(self):    
-    pass
+  def __init__(self, position_tolerance: float = 10.0, angle_tolerance: float = np.pi / 180., s3_cache: bool = True):
+    """Keyword arguments:
+    position_tolerance -- maximum error, in meters, of the position shown by Cesium once the track is simplified (default 10).
+      None keeps every 5th sample instead.
+    angle_tolerance -- maximum error, in radians, of the roll, pitch and heading shown by Cesium (default 1 degree).
+    s3_cache -- read the files ingested from s3 through the local cache (see S3Cache), downloading them only once (default True).
+    """
+    self.position_tolerance = position_tolerance
+    self.angle_tolerance = angle_tolerance
+    self.s3_cache = s3_cache
   
   def ingest(self, url: str, type: str = "local") -> np.array:
     """Returns a numpy array representing the raw data file.
@@ -29,34 +39,85 @@ class NavCZMLDataProcess(CZMLDataProcess):
     integrated_data = self._integration(transformed_data)
     return integrated_data
 
-  def prep_visualization(self, data: pd.DataFrame) -> str:
+  def prep_visualization(self, data: pd.DataFrame, outfile=None, compress: str = None) -> str:
+    """Returns the CZML string, or the outfile it is streamed to.
+
+    Keyword arguments:
+    outfile -- path or binary file-like object to stream the CZML to, in bounded chunks (default None, return the string).
+    compress -- None or gzip, compression of the streamed CZML (default None).
+    """
     # the dataframe needs these features/cols: timestamp, longitude, latitude, altitude, roll, pitch, heading
     length = data.shape[0]
     nav_czml_writer = NavCzmlWriter(length)
     nav_czml_writer.set_with_df(data)
+    if outfile is not None:
+      nav_czml_writer.write(outfile, compress=compress)
+      return outfile
     nav_czml_str = nav_czml_writer.get_czml_string()
     return nav_czml_str
 
+  def prep_visualization_multires(self, data: pd.DataFrame, window: int = 1800, overview_tolerance: float = 200.0,
+                                  overview_angle_tolerance: float = np.pi / 36., outdir: str = None, compress: str = None) -> list:
+    """Returns the CZML documents of a progressive load: a coarse overview of the whole flight, then a detail document per time window.
+
+    The overview is a complete document (3d model, path, availability) of a coarser simplification of the track, small enough to render right away.
+    Each detail document only holds the samples of its time window, for the same entity, and is merged into it by the client
+    (e.g. CzmlDataSource.process, as done by CZMLViz when given the list).
+
+    Keyword arguments:
+    window -- duration, in seconds, of the time window of each detail document (default 1800).
+    overview_tolerance -- maximum error, in meters, of the position shown by the overview (default 200).
+    overview_angle_tolerance -- maximum error, in radians, of the roll, pitch and heading shown by the overview (default 5 degrees).
+    outdir -- folder to stream the documents to, as overview.czml and detail_<n>.czml (default None, return the strings).
+    compress -- None or gzip, compression of the streamed documents (default None).
+    """
+    time = data['timestamp'].values.astype('datetime64[s]').astype(np.int64)
+    overview = simplify_trajectory(time, data['longitude'].values, data['latitude'].values, data['altitude'].values,
+                                   [data['roll'].values, data['pitch'].values, data['heading'].values],
+                                   overview_tolerance, overview_angle_tolerance)
+    writers = [NavCzmlWriter(int(np.count_nonzero(overview)))]
+    writers[0].set_with_df(data[overview])
+
+    # windows aligned on the start of the flight, the samples at a boundary belong to the next window
+    boundaries = np.searchsorted(time, np.arange(time[0], time[-1] + 1, window), side="left") if time.size else []
+    boundaries = list(boundaries) + [time.size]
+    for start, stop in zip(boundaries[:-1], boundaries[1:]):
+      if stop > start:
+        writer = NavCzmlWriter(stop - start, detail=True)
+        writer.set_with_df(data.iloc[start:stop])
+        writers.append(writer)
+
+    if outdir is None:
+      return [writer.get_czml_string() for writer in writers]
+    os.makedirs(outdir, exist_ok=True)
+    extension = ".czml.gz" if compress == "gzip" else ".czml"
+    outfiles = [os.path.join(outdir, "overview" + extension)]
+    outfiles += [os.path.join(outdir, "detail_{:04d}{}".format(index, extension)) for index in range(len(writers) - 1)]
+    for writer, outfile in zip(writers, outfiles):
+      writer.write(outfile, compress=compress)
+    return outfiles
+
 
   # data preprocessing steps
 
   def _cleaning(self, data: np.array) -> pd.DataFrame:
-    col_index_map = self._get_col_index_map()
-    data = deepcopy(data)
+    # the raw data only holds the necessary columns, in the order of the column index map
+    col_position_map = {key: position for position, key in enumerate(self._get_col_index_map())}
 
     # data extraction
     # scrape necessary data columns 
-    time = data[:, col_index_map["time"]]
-    latitude = data[:, col_index_map["latitude"]]
-    longitude = data[:, col_index_map["longitude"]]
-    altitude = data[:, col_index_map["altitude"]]
-    heading = data[:, col_index_map["heading"]] * np.pi / 180. - np.pi / 2.
-    pitch = data[:, col_index_map["pitch"]] * np.pi / 180.
-    roll = data[:, col_index_map["roll"]] * np.pi / 180.
+    time = data[:, col_position_map["time"]]
+    latitude = data[:, col_position_map["latitude"]]
+    longitude = data[:, col_position_map["longitude"]]
+    altitude = data[:, col_position_map["altitude"]]
+    heading = data[:, col_position_map["heading"]] * np.pi / 180. - np.pi / 2.
+    pitch = data[:, col_position_map["pitch"]] * np.pi / 180.
+    roll = data[:, col_position_map["roll"]] * np.pi / 180.
     
     # data masks
     # remove nan values
-    mask = np.logical_not(np.isnan(latitude))
+    mask = np.logical_not(np.isnan(time))
+    mask = np.logical_and(mask, np.logical_not(np.isnan(latitude)))
     mask = np.logical_and(mask, np.logical_not(np.isnan(longitude)))
     mask = np.logical_and(mask, np.logical_not(np.isnan(altitude)))
     mask = np.logical_and(mask, np.logical_not(np.isnan(heading)))
@@ -71,17 +132,32 @@ class NavCZMLDataProcess(CZMLDataProcess):
     mask = np.logical_and(mask, unique)
     
     # apply masks/filter and sample data
-    f_time = time[mask].astype('datetime64[s]')[::5]
-    f_latitude = latitude[mask][::5]
-    f_longitude = longitude[mask][::5]
-    f_altitude = altitude[mask][::5]
-    f_heading = heading[mask][::5]
-    f_pitch = pitch[mask][::5]
-    f_roll = roll[mask][::5]
+    f_time = time[mask]
+    f_latitude = latitude[mask]
+    f_longitude = longitude[mask]
+    f_altitude = altitude[mask]
+    f_heading = heading[mask]
+    f_pitch = pitch[mask]
+    f_roll = roll[mask]
+
+    sample = self._sampling(f_time, f_longitude, f_latitude, f_altitude, f_roll, f_pitch, f_heading)
+    f_time = f_time[sample].astype('datetime64[s]')
+    f_latitude = f_latitude[sample]
+    f_longitude = f_longitude[sample]
+    f_altitude = f_altitude[sample]
+    f_heading = f_heading[sample]
+    f_pitch = f_pitch[sample]
+    f_roll = f_roll[sample]
 
     filtered_data = pd.DataFrame(data = {"timestamp": f_time, "latitude": f_latitude, "longitude": f_longitude, "altitude": f_altitude, "heading": f_heading, "pitch": f_pitch, "roll": f_roll})
     return filtered_data
   
+  def _sampling(self, time, longitude, latitude, altitude, roll, pitch, heading):
+    # keep the samples needed for the track to stay within the error tolerances, fewer on straight legs, more in turns
+    if self.position_tolerance is None:
+      return slice(None, None, 5)
+    return simplify_trajectory(time, longitude, latitude, altitude, [roll, pitch, heading], self.position_tolerance, self.angle_tolerance)
+
   def _transformation(self, data: pd.DataFrame) -> pd.DataFrame:
     #  no transformation needed
     return data
@@ -94,11 +170,14 @@ class NavCZMLDataProcess(CZMLDataProcess):
   # ingestion variations
 
   def _ingest_from_s3(self, url: str) -> np.array:
-    s3_client = boto3.client('s3')
-    [bucket_name, objectKey] = self._get_s3_details(url)
-    s3_file = s3_client.get_object(Bucket=bucket_name, Key=objectKey)
+    if self.s3_cache:
+      # the file is parsed in full before the cache entry is released
+      with S3Cache().get(url) as entry:
+        return self._generator_to_np(entry.path)
 
-    file = s3_file['Body'].iter_lines()
+    # the body is streamed to the parser, without holding the whole file in memory.
+    # the client is shared by every ingestion of the process.
+    file, _ = open_s3(url)
 
     data = self._generator_to_np(file)
     return data
@@ -111,13 +190,7 @@ class NavCZMLDataProcess(CZMLDataProcess):
   # utils
 
   def _get_s3_details(self, url) -> list:
-    url = url.replace("s3://", "")
-    temp_url = url.split("/")
-    bucket_name = temp_url[0]
-    
-    temp_url = url.split(bucket_name+"/")
-    objectKey = temp_url[1]  # key should not start with /
-    return [bucket_name, objectKey]
+    return list(get_s3_details(url))
   
   def _get_col_index_map(self):
     # represents the column number for each key, inside the input csv type file.
@@ -133,29 +206,18 @@ class NavCZMLDataProcess(CZMLDataProcess):
     
   def _generator_to_np(self, infile: Generator) -> np.array:
     # As the data in txt is all string, to put it inside numpy array, we need to convert it to appropirate types
-    
-    # create null converters
-    converters = {}
-    for i in range(33): # 33 cols/feature data
-      converters[i] = lambda _: np.nan 
-    
-    # upadate converters for appropriate faeture/cols with appropriate functions
+    # Only the necessary columns are parsed (by the pandas C parser), and converted column by column:
+    # time to seconds since unix epoch, the others to float. Missing or malformed values become nan.
     col_index_map = self._get_col_index_map()
-    converters[col_index_map["time"]] = lambda x: np.datetime64(x, 's').astype(np.int64)
-    converters[col_index_map["latitude"]] = self._string_to_float
-    converters[col_index_map["longitude"]] = self._string_to_float
-    converters[col_index_map["altitude"]] = self._string_to_float
-    converters[col_index_map["heading"]] = self._string_to_float
-    converters[col_index_map["pitch"]] = self._string_to_float
-    converters[col_index_map["roll"]] = self._string_to_float
-    
-    # apply converter during txt load
-    return np.loadtxt(infile, delimiter=',', converters=converters)
-  
-  def _string_to_float(self, str: str) -> np.float64:
-        value = np.nan
-        try:
-            value = float(str)
-        except:
-            pass
-        return value
\ No newline at end of file
+    columns = list(col_index_map.values())
+    df = pd.read_csv(infile, header=None, usecols=columns, dtype={col_index_map["time"]: str}, skipinitialspace=True)
+
+    data = np.full((df.shape[0], len(columns)), np.nan, dtype=np.float64)
+    for position, (key, column) in enumerate(col_index_map.items()):
+      if key == "time":
+        time = pd.to_datetime(df[column], errors="coerce", utc=True, format="ISO8601").dt.tz_localize(None).to_numpy(dtype="datetime64[ns]")
+        valid = np.logical_not(np.isnat(time))
+        data[valid, position] = time[valid].astype("datetime64[s]").astype(np.int64)
+      else:
+        data[:, position] = pd.to_numeric(df[column], errors="coerce").to_numpy(dtype=np.float64)
+    return data
@@ -1,6 +1,6 @@
 import os
+import uuid
 import shutil
-import boto3
 import numpy as np
 import pandas as pd
 import xarray as xr
@@ -10,19 +10,64 @@ from typing import Generator
 
 from .abstract.tiles_pointcloud_data_process import TilesPointCloudDataProcess
 from .utils.tiles_writer import write_tiles
+from .utils.zarr_index import build_time_index, build_location_index
+from .utils.geolocation import geolocate_gates
+from .utils.zarr_storage import get_storage_preset, create_store_arrays, write_location, resize_location
+from .utils.manifest import Manifest, file_lock, hash_file, hash_params
+from .utils.s3_io import get_s3_details, read_s3
+from .utils.s3_cache import S3Cache
+
+try:
+  import dask
+except ImportError:
+  # without dask, variables are still read lazily, by the netcdf backend, when their values are accessed
+  dask = None
 
 class RadRangeTilesPointCloudDataProcess(TilesPointCloudDataProcess):
-  def __init__(self):
+  def __init__(self, block_size: int = None, spill_dir: str = None, s3_cache: bool = True,
+               profile_range: tuple = None, dask_chunks: int = None, storage: str = "default",
+               geolocation_precision: str = "float64"):
+    """Keyword arguments:
+    block_size -- number of radar profiles processed at a time (default None).
+      When set, preprocess streams the dataset block by block into the zarr store,
+      so peak memory depends on the block size rather than on the flight length.
+    spill_dir -- folder where files ingested from s3 are downloaded to, instead of memory (default None, in memory).
+      Only used without the s3 cache.
+    s3_cache -- read the files ingested from s3 through the local cache (see S3Cache), downloading them only once (default True).
+    profile_range -- (start, stop) indices of the radar profiles to read, e.g. (0, 10000) (default None, every profile).
+      Every range has its own zarr store, e.g. temp/<date>/<name>/zarr_profiles_0_10000.
+    dask_chunks -- number of radar profiles per dask chunk (default None, no dask). Raises ValueError when dask is not installed.
+    storage -- storage preset of the zarr store: default, fast-write, small-on-disk or fast-random-read (default default).
+      See utils/zarr_storage.py for their chunking, compression and layout.
+    geolocation_precision -- float64 or float32, precision of the location of the radar gates (default float64).
+      float32 is faster: longitudes and latitudes are within one float32 ulp of float64, altitudes within 2e-3 m
+      (see utils/geolocation.py).
+    """
+    if dask_chunks is not None and dask is None:
+      raise ValueError("dask_chunks needs the dask package")
     self.url = None
     self.OPENED_FILE_REF = None
+    self.SPILL_FILE = None
+    self.CACHE_ENTRY = None
+    self.spill_dir = spill_dir
+    self.s3_cache = s3_cache
+    self.profile_range = profile_range
+    self.dask_chunks = dask_chunks
+    self.input_hash = None
+    self.first_hour = None
 
     self.campaign = 'Olympex'
     self.collection = "AirborneRadar"
     self.dataset = "gpmValidationOlympexcrs"
     self.variables = ["zku"]
+    # the only variables read from the input files
+    self.input_variables = ['timed', 'zku', 'lat', 'lon', 'altitude', 'roll', 'pitch', 'head', 'range']
     self.renderers = ["point_cloud"]
 
-    self.chunk = 262144
+    self.storage = get_storage_preset(storage)
+    self.chunk = self.storage["chunk"]
+    self.geolocation_precision = geolocation_precision
+    self.block_size = block_size
     self.to_rad = np.pi / 180
     self.to_deg = 180 / np.pi
 
@@ -39,11 +84,35 @@ class RadRangeTilesPointCloudDataProcess(TilesPointCloudDataProcess):
       return self._ingest_from_local(url)
   
   def preprocess(self, data: xr.Dataset) -> str:
-    cleaned_data = self._cleaning(data)
-    transformed_data = self._transformation(cleaned_data)
-    integrated_data = self._integration(transformed_data)
-    self.OPENED_FILE_REF.close()
-    return integrated_data
+    zarr_path = self._get_zarr_path()
+    manifest_path = os.path.join(os.path.dirname(zarr_path), "manifest.json")
+    zarr_key = self._get_zarr_key()
+    try:
+      if Manifest(manifest_path).is_current(os.path.basename(zarr_path), zarr_key):
+        # same input file and same processing parameters, reuse the zarr store of a previous run
+        return zarr_path
+
+      cleaned_data = self._cleaning(data)
+      if self.block_size:
+        integrated_data = self._stream_integration(cleaned_data)
+      else:
+        transformed_data = self._transformation(cleaned_data)
+        integrated_data = self._integration(transformed_data)
+    except BaseException:
+      # no half written store is left behind
+      shutil.rmtree(self._get_partial_zarr_dir(), ignore_errors=True)
+      raise
+    finally:
+      # the input file is released even when the preprocessing fails
+      self._close()
+
+    # published and recorded under a lock, the manifest is reloaded so the entries of other processes are kept
+    with file_lock(zarr_path + '.lock'):
+      self._publish_zarr_dir(integrated_data, zarr_path)
+      manifest = Manifest(manifest_path)
+      manifest.update(os.path.basename(zarr_path), zarr_key, [os.path.basename(zarr_path)])
+      manifest.save()
+    return zarr_path
 
   def prep_visualization(self, zarr_data_path: str) -> str:
     point_cloud_folder = zarr_data_path+"_point_cloud"
@@ -55,12 +124,12 @@ class RadRangeTilesPointCloudDataProcess(TilesPointCloudDataProcess):
   def _cleaning(self, data: xr.Dataset) -> xr.Dataset:
     # data extraction
     # scrape necessary data columns 
-    extracted_data = data[['timed', 'zku', 'lat', 'lon', 'altitude', 'roll', 'pitch', 'head', 'range']]
+    extracted_data = data[self.input_variables]
     return extracted_data
 
-  def _transformation(self, data: xr.Dataset) -> pd.DataFrame:
+  def _transformation(self, data: xr.Dataset, time: np.ndarray = None) -> pd.DataFrame:
     #  transform the data to a suitable data formatting
-    hour = data['timed'].values
+    # time (seconds since unix epoch, one per profile) can be precomputed, e.g. when data is a block of profiles
     lat = data['lat'].values
     lon = data['lon'].values
     alt = data['altitude'].values # altitude of aircraft in meters
@@ -71,49 +140,34 @@ class RadRangeTilesPointCloudDataProcess(TilesPointCloudDataProcess):
     rad_range = data["range"].values # has lower count than ref
     
     # time correction and conversion:
-    base_time = self._get_date_from_url(self.url)
-    hour = self._add24hr(hour)
-    delta = (hour * 3600).astype('timedelta64[s]') + base_time
-    time = (delta - np.datetime64('1970-01-01')).astype('timedelta64[s]').astype(np.int64)
-
-    # transform ref to 1d array and repeat other columns to match data dimension
-
-    num_rows = ref.shape[0] # number of rows
-    num_cols = ref.shape[1] # number of cols
+    if time is None:
+      time = self._get_profile_time(data)
 
-    time = np.repeat(time, num_cols)
-    lon = np.repeat(lon, num_cols)
-    lat = np.repeat(lat, num_cols)
-    alt = np.repeat(alt, num_cols)
-    roll = np.repeat(roll * self.to_rad, num_cols)
-    pitch = np.repeat(pitch * self.to_rad, num_cols)
-    head = np.repeat(head * self.to_rad, num_cols)
-    rad_range = np.tile(rad_range, num_rows)
-    ref = ref.flatten()
+    # sort by time
+    # all the gates of a profile share its time, so sorting the profiles (usually already in order, but for
+    # the midnight wrap) sorts the points, without sorting rows x gates times
+
+    if np.any(np.diff(time) < 0):
+      order = np.argsort(time, kind='stable')
+      time = time[order]
+      lat = lat[order]
+      lon = lon[order]
+      alt = alt[order]
+      roll = roll[order]
+      pitch = pitch[order]
+      head = head[order]
+      ref = ref[order]
 
     # curtain creation
+    # (profiles, gates) location of every gate, the attitude trigonometry is computed once per profile
 
-    x, y, z = self._down_vector(roll, pitch, head)
-    x = np.multiply(x, np.divide(rad_range, 111000 * np.cos(lat * self.to_rad)))
-    y = np.multiply(y, np.divide(rad_range, 111000))
-    z = np.multiply(z, rad_range)
-    lon = np.add(-x, lon)
-    lat = np.add(-y, lat)
-    alt = np.add(z, alt)
-
-    # sort by time
-
-    sort_idx = np.argsort(time)
-    lon = lon[sort_idx]
-    lat = lat[sort_idx]
-    alt = alt[sort_idx]
-    ref = ref[sort_idx]
-    time = time[sort_idx]
+    lon, lat, alt = geolocate_gates(lon, lat, alt, roll, pitch, head, rad_range, dtype=self.geolocation_precision)
 
     # remove nan and infinite using mask (dont use masks filtering for values used for curtain creation)
+    # the time of the points kept is their profile time, repeated by the number of points kept per profile
 
     mask = np.logical_and(np.isfinite(ref), alt > 0)
-    time = time[mask]
+    time = np.repeat(time, np.count_nonzero(mask, axis=1))
     ref = ref[mask]
     lon = lon[mask]
     lat = lat[mask]
@@ -132,43 +186,104 @@ class RadRangeTilesPointCloudDataProcess(TilesPointCloudDataProcess):
   
   def _integration(self, data: pd.DataFrame) -> str:
     # data from multiple sources can be integrated into intermediate file format, e.g. zarr file. The intermeidate format should be compatible with viz prepration step
-    time = data['time'].values
-    ref = data['ref'].values
-    lon = data['lon'].values
-    lat = data['lat'].values
-    alt = data['alt'].values
 
     # path creation
     zarr_path = self._create_zarr_dir()
 
-    # create a ZARR directory in the path provided
-    store = zarr.DirectoryStore(zarr_path)
-    root = zarr.group(store=store)
+    # create a ZARR directory in the path provided, with arrays of the final size
+    root = self._create_zarr_store(zarr_path, data.shape[0])
+
+    # Now write the preprocessed data, every chunk is written once
+    epoch = np.min(data['time'].values)
+    self._write_to_zarr(root, self._get_zarr_columns(data, epoch), 0)
 
-    # Create empty rows for modified data inside zarr
-    z_chunk_id = root.create_dataset('chunk_id', shape=(0, 2), chunks=None, dtype=np.int64)
-    z_location = root.create_dataset('location', shape=(0, 3), chunks=(self.chunk, None), dtype=np.float32)
-    z_time = root.create_dataset('time', shape=(0), chunks=(self.chunk), dtype=np.int32)
-    z_vars = root.create_group('value')
-    z_ref = z_vars.create_dataset('ref', shape=(0), chunks=(self.chunk), dtype=np.float32)
-    n_time = np.array([], dtype=np.int64)
+    # save it.
+    self._finalize_zarr(root, epoch)
+    return zarr_path
+
+  def _stream_integration(self, data: xr.Dataset) -> str:
+    # transformation and integration of the data, one block of profiles at a time.
+    # Only the per profile columns are read in full, the 2d radar data is read block by block.
+    time = self._get_profile_time(data)
+    epoch = np.min(time)
 
-    # Now populate (append) the empty rows in ZARR dir with preprocessed data
-    z_location.append(np.stack([lon, lat, alt], axis=-1))
-    z_ref.append(ref)
-    n_time = np.append(n_time, time)
+    # blocks are written one after the other, so profiles are read in time order
+    order = None
+    if np.any(np.diff(time) < 0):
+      order = np.argsort(time, kind='stable')
+
+    # the arrays are created at the size of every gate of every profile, and shrunk to the points kept once written
+    profile_dim = data['zku'].dims[0]
+    num_rows, num_cols = data['zku'].shape
+    zarr_path = self._create_zarr_dir()
+    root = self._create_zarr_store(zarr_path, num_rows * num_cols)
+
+    # points are written a whole number of chunks at a time, the rest waits for the next block,
+    # so every chunk is compressed and written once
+    size = 0
+    pending = []
+    for start in range(0, num_rows, self.block_size):
+      block_idx = slice(start, min(start + self.block_size, num_rows))
+      if order is not None:
+        block_idx = order[block_idx]
+      block = data.isel({profile_dim: block_idx})
+      transformed_block = self._transformation(block, time[block_idx])
+      pending.append(self._get_zarr_columns(transformed_block, epoch))
+      num_pending = sum(columns['time'].shape[0] for columns in pending)
+      if num_pending >= self.chunk:
+        columns = {name: np.concatenate([block_columns[name] for block_columns in pending]) for name in pending[0]}
+        num_written = num_pending - num_pending % self.chunk
+        size = self._write_to_zarr(root, {name: column[:num_written] for name, column in columns.items()}, size)
+        pending = [{name: column[num_written:] for name, column in columns.items()}]
+    for columns in pending:
+      size = self._write_to_zarr(root, columns, size)
+    self._resize_zarr_store(root, size)
+
+    self._finalize_zarr(root, epoch)
+    return zarr_path
 
-    idx = np.arange(0, n_time.size, self.chunk)
+  def _create_zarr_store(self, zarr_path: str, size: int) -> zarr.hierarchy.Group:
+    store = zarr.DirectoryStore(zarr_path)
+    root = zarr.group(store=store)
+
+    # Create the arrays for the modified data inside zarr, at their final size (nothing is written yet)
+    create_store_arrays(root, size, self.storage, ['ref'])
+    return root
+
+  def _get_zarr_columns(self, data: pd.DataFrame, epoch: np.int64) -> dict:
+    # the columns, in the dtypes of the zarr arrays
+    return {
+      'lon': data['lon'].values.astype(np.float32, copy=False),
+      'lat': data['lat'].values.astype(np.float32, copy=False),
+      'alt': data['alt'].values.astype(np.float32, copy=False),
+      'time': (data['time'].values - epoch).astype(np.int32),
+      'ref': data['ref'].values.astype(np.float32, copy=False)
+    }
+
+  def _write_to_zarr(self, root: zarr.hierarchy.Group, columns: dict, start: int) -> int:
+    # write the columns to the region of the arrays starting at start, returns the end of the region
+    stop = start + columns['time'].shape[0]
+    write_location(root, start, columns['lon'], columns['lat'], columns['alt'])
+    root['time'][start:stop] = columns['time']
+    root['value']['ref'][start:stop] = columns['ref']
+    return stop
+
+  def _resize_zarr_store(self, root: zarr.hierarchy.Group, size: int):
+    resize_location(root, size)
+    root['time'].resize(size)
+    root['value']['ref'].resize(size)
+
+  def _finalize_zarr(self, root: zarr.hierarchy.Group, epoch: np.int64):
+    # index the first timestamp of every chunk
+    z_time = root['time']
+    idx = np.arange(0, z_time.size, self.chunk)
     chunks = np.zeros(shape=(idx.size, 2), dtype=np.int64)
     chunks[:, 0] = idx
-    chunks[:, 1] = n_time[idx]
-    z_chunk_id.append(chunks)
+    chunks[:, 1] = z_time.get_coordinate_selection(idx).astype(np.int64) + epoch
+    root.create_dataset('chunk_id', data=chunks, chunks=None, dtype=np.int64)
+    build_time_index(root)
+    build_location_index(root)
 
-    epoch = np.min(n_time)
-    n_time = (n_time - epoch).astype(np.int32)
-    z_time.append(n_time)
-
-    # save it.
     root.attrs.put({
         "campaign": self.campaign,
         "collection": self.collection,
@@ -178,48 +293,79 @@ class RadRangeTilesPointCloudDataProcess(TilesPointCloudDataProcess):
         "epoch": int(epoch)
     })
 
-    return zarr_path
-
   # ingesting variations
 
   def _ingest_from_local(self, path: str) -> xr.Dataset:
     self.url = path
+    self.input_hash = hash_file(path)
     data = self._generator_to_xr(path)
     return data
 
   def _ingest_from_s3(self, url: str) -> xr.Dataset:
     self.url = url
-    s3_client = boto3.client('s3')
-    [bucket_name, objectKey] = self._get_s3_details(url)
-
-    s3_file = s3_client.get_object(Bucket=bucket_name, Key=objectKey)
-    file = s3_file['Body'].read()
-
-    data = self._generator_to_xr(file)
+    if self.s3_cache:
+      # the cache entry is read lazily, it is kept from eviction until the dataset is closed
+      self.CACHE_ENTRY = S3Cache().get(url)
+      self.input_hash = "{}:{}".format(url, self.CACHE_ENTRY.etag)
+      return self._generator_to_xr(self.CACHE_ENTRY.path)
+
+    # parallel ranged GETs on the shared client, into memory or into a spill file
+    s3_file = read_s3(url, spill_dir=self.spill_dir)
+    self.input_hash = "{}:{}".format(url, s3_file.etag)
+    self.SPILL_FILE = s3_file.path
+
+    data = self._generator_to_xr(s3_file.data if s3_file.path is None else s3_file.path)
     return data
 
   # utils
 
   def _get_s3_details(self, url) -> list:
-    url = url.replace("s3://", "")
-    temp_url = url.split("/")
-    bucket_name = temp_url[0]
-    
-    temp_url = url.split(bucket_name+"/")
-    objectKey = temp_url[1]  # key should not start with /
-    return [bucket_name, objectKey]
+    return list(get_s3_details(url))
   
   def _generator_to_xr(self, infile: Generator) -> xr.Dataset:
     # As the data in netcdf format, to put it inside numpy array, we need to read it first.
-    ds = xr.open_dataset(infile, decode_cf=False) # dont close opened dataset just yet
+    # The dataset is opened lazily: only the needed variables, of the selected profiles, are read once accessed,
+    # and without caching, so the values read are not kept alive by the dataset.
+    ds = xr.open_dataset(infile, decode_cf=False, cache=False) # dont close opened dataset just yet
     self.OPENED_FILE_REF = ds # close later, after data preprocessing.
+    ds = ds[self.input_variables]
+
+    profile_dim = ds['zku'].dims[0]
+    # the day of the profiles is relative to the first profile of the file, not of the selected range
+    self.first_hour = float(ds['timed'][0])
+    if self.profile_range is not None:
+      ds = ds.isel({profile_dim: slice(*self.profile_range)})
+    if self.dask_chunks:
+      ds = ds.chunk({profile_dim: self.dask_chunks})
     return ds
+
+  def _close(self):
+    # close the dataset opened by ingest, and remove its spill file or release its cache entry
+    if self.OPENED_FILE_REF is not None:
+      self.OPENED_FILE_REF.close()
+      self.OPENED_FILE_REF = None
+    if self.SPILL_FILE is not None:
+      os.remove(self.SPILL_FILE)
+      self.SPILL_FILE = None
+    if self.CACHE_ENTRY is not None:
+      self.CACHE_ENTRY.release()
+      self.CACHE_ENTRY = None
   
+  def _get_profile_time(self, data: xr.Dataset) -> np.ndarray:
+    # time of each profile, in seconds since unix epoch
+    hour = data['timed'].values
+    base_time = self._get_date_from_url(self.url)
+    hour = self._add24hr(hour)
+    delta = (hour * 3600).astype('timedelta64[s]') + base_time
+    time = (delta - np.datetime64('1970-01-01')).astype('timedelta64[s]').astype(np.int64)
+    return time
+
   def _add24hr(self, hour: np.ndarray) -> np.ndarray:
     # time correction
     # time in CRS for going over the next day in UTC
     # so add 24 hours to the time to get the correct time"""
-    mask = np.where(hour < hour[0])
+    first_hour = hour[0] if self.first_hour is None else self.first_hour
+    mask = np.where(hour < first_hour)
     hour[mask] = hour[mask] + 24
     return hour
   
@@ -231,18 +377,61 @@ class RadRangeTilesPointCloudDataProcess(TilesPointCloudDataProcess):
     np_date = np.datetime64('{}-{}-{}'.format(date[:4], date[4:6], date[6:]))
     return np_date
 
-  def _down_vector(self, roll, pitch, head):
-    x = np.sin(roll) * np.cos(head) + np.cos(roll) * np.sin(pitch) * np.sin(head)
-    y = -np.sin(roll) * np.sin(head) + np.cos(roll) * np.sin(pitch) * np.cos(head)
-    z = -np.cos(roll) * np.cos(pitch)
-    return (x, y, z)
+  def _get_zarr_path(self) -> str:
+    # one directory per input file, so that files of the same date do not overwrite each other,
+    # and one store per profile range, so that slices of the same file (e.g. processed in parallel) do not either
+    date = self._get_date_from_url(self.url)
+    name = os.path.splitext(os.path.basename(self.url))[0]
+    zarr_name = 'zarr'
+    if self.profile_range is not None:
+      zarr_name += '_profiles_' + '_'.join(str(bound) for bound in self.profile_range)
+    return 'temp/' + str(date) + '/' + name + '/' + zarr_name
+
+  def _get_zarr_key(self) -> str:
+    # everything the zarr store depends on
+    return hash_params({
+      "input": self.input_hash,
+      "chunk": self.chunk,
+      "block_size": self.block_size,
+      "profile_range": self.profile_range,
+      "storage": self.storage,
+      "geolocation_precision": self.geolocation_precision,
+      "dataset": self.dataset,
+      "variables": self.variables
+    })
+
+  def _get_partial_zarr_dir(self) -> str:
+    # directory private to this process, where the zarr file is written
+    return self._get_zarr_path() + '.partial-' + str(os.getpid())
 
   def _create_zarr_dir(self):
     """Create a directory to hold zarr file
+    The zarr file is written in a directory private to this process, and published once complete.
     """
-    date = self._get_date_from_url(self.url)
-    tempdir = 'temp/' + str(date) + '/zarr'
+    tempdir = self._get_partial_zarr_dir()
     if os.path.exists(tempdir):
         shutil.rmtree(tempdir)
     os.makedirs(tempdir)
-    return tempdir
\ No newline at end of file
+    return tempdir
+
+  def _publish_zarr_dir(self, tempdir: str, zarr_path: str):
+    """Replace the zarr file of a previous run, if any, by the newly written one. Called under the lock of zarr_path.
+    zarr_path is a symbolic link to the latest complete zarr file, swapped in one rename, so it always exists for readers.
+    """
+    version_dir = '{}.{}'.format(zarr_path, uuid.uuid4().hex)
+    os.rename(tempdir, version_dir)
+    link = zarr_path + '.link-' + str(os.getpid())
+    if os.path.lexists(link):
+        os.remove(link)
+    os.symlink(os.path.basename(version_dir), link)
+
+    previous_dir = None
+    if os.path.islink(zarr_path):
+        previous_dir = os.path.join(os.path.dirname(zarr_path), os.readlink(zarr_path))
+    elif os.path.exists(zarr_path):
+        # zarr file written before the stores were versioned, a plain directory, moved aside first
+        previous_dir = zarr_path + '.old-' + str(os.getpid())
+        os.rename(zarr_path, previous_dir)
+    os.replace(link, zarr_path)
+    if previous_dir is not None:
+        shutil.rmtree(previous_dir, ignore_errors=True)
\ No newline at end of file
@@ -0,0 +1,65 @@
+import numpy as np
+
+# powers of ten, to count the digits of int64 values
+powers_of_ten = 10 ** np.arange(1, 19, dtype=np.int64)
+
+def fixed_point_chars(values, precision):
+    """Returns the fixed precision text of every value, as an (n, width) uint8 matrix of ascii characters,
+    and the (n, width) mask of the characters in use (the text is right aligned, unused characters are on its left).
+
+    Args:
+        values (numpy.ndarray): 1d array of finite numbers.
+        precision (int): number of digits after the decimal point, 0 for integers.
+    """
+    values = np.asarray(values, dtype=np.float64)
+    if not np.all(np.isfinite(values)):
+        raise ValueError("only finite values can be written to json")
+    scaled = np.rint(values * 10 ** precision)
+    if np.any(np.abs(scaled) >= 2.0 ** 63):
+        raise ValueError("values too large to be written with {} digits after the decimal point".format(precision))
+    scaled = scaled.astype(np.int64)
+    negative = scaled < 0
+    magnitude = np.abs(scaled)
+    size = magnitude.size
+
+    # used digits of every value, at least one digit before the decimal point
+    num_used_digits = np.maximum(np.searchsorted(powers_of_ten, magnitude, side="right") + 1, precision + 1)
+    num_digits = int(np.max(num_used_digits)) if size else precision + 1
+    integer_digits = num_digits - precision
+
+    digits = np.empty((size, num_digits), dtype=np.uint8)
+    for i in range(num_digits - 1, -1, -1):
+        digits[:, i] = magnitude % 10 + ord("0")
+        magnitude //= 10
+
+    width = 1 + integer_digits + (1 + precision if precision else 0)
+    chars = np.empty((size, width), dtype=np.uint8)
+    mask = np.ones((size, width), dtype=bool)
+    chars[:, 0] = ord("-")
+    mask[:, 0] = negative
+    chars[:, 1:1 + integer_digits] = digits[:, :integer_digits]
+    mask[:, 1:1 + integer_digits] = np.arange(integer_digits) >= (num_digits - num_used_digits)[:, np.newaxis]
+    if precision:
+        chars[:, 1 + integer_digits] = ord(".")
+        chars[:, 2 + integer_digits:] = digits[:, integer_digits:]
+    return chars, mask
+
+
+def format_rows(columns, precisions):
+    """Returns the comma separated text of columns interleaved row by row, e.g. t0,x0,y0,t1,x1,y1,...
+
+    Numbers are formatted with numpy only, without creating a python object per number.
+
+    Args:
+        columns (list): 1d arrays of the same length.
+        precisions (list): number of digits after the decimal point, for each column.
+    """
+    chars = []
+    masks = []
+    for values, precision in zip(columns, precisions):
+        column_chars, column_mask = fixed_point_chars(values, precision)
+        chars.extend([column_chars, np.full((column_chars.shape[0], 1), ord(","), dtype=np.uint8)])
+        masks.extend([column_mask, np.ones((column_mask.shape[0], 1), dtype=bool)])
+    chars = np.hstack(chars)
+    mask = np.hstack(masks)
+    return chars[mask].tobytes()[:-1].decode("ascii")
@@ -1,8 +1,11 @@
+import os
+import zlib
 import numpy as np
 import json
 
 from copy import deepcopy
 from .czml_model import model, czml_head
+from .czml_json import format_rows
 
 class NavCzmlWriter:
     """
@@ -10,6 +13,11 @@ class NavCzmlWriter:
 
     Args:
         length (int): The length of data points to be generated.
+        coordinate_precision (int): The number of decimals written for longitudes and latitudes.
+        altitude_precision (int): The number of decimals written for altitudes.
+        angle_precision (int): The number of decimals written for roll, pitch and heading.
+        detail (bool): Writes a detail packet, i.e. only the samples of the position and orientation of the
+            "Flight Track" entity, to be merged by the client into the entity of an already loaded document.
         time_window (tuple): A tuple containing the start and end time of the data.
         time_steps (numpy.ndarray): An array of time steps for the generated data.
         longitude (numpy.ndarray): An array of longitudes for the generated data.
@@ -42,52 +50,133 @@ class NavCzmlWriter:
             Converts the time data into CZML-compatible time window and time steps.
         
         get_czml_string():
-            Returns the CZML data as a JSON string.
+            Returns the CZML data as a JSON string. The sampled numbers are written with a fixed precision,
+            by numpy, without a python object per number.
+
+        write(outfile, chunk_rows, compress):
+            Writes the CZML data to a path or file-like object in bounded chunks, optionally gzip compressed.
+
+        write_async(writer, chunk_rows, compress):
+            Writes the CZML data to an asyncio stream writer in bounded chunks.
     """
-    def __init__(self, length):
+    def __init__(self, length, coordinate_precision=6, altitude_precision=2, angle_precision=6, detail=False):
     # def __init__(self, length):
         self.model = deepcopy(model)
+        if detail:
+            # the availability, 3d model and path are the ones of the loaded document
+            self.model = {key: self.model[key] for key in ['id', 'position', 'properties']}
         self.czml_head = deepcopy(czml_head)
         self.length = length
-        self.model['position']['cartographicDegrees'] = [0] * 4 * length
-        self.model['properties']['roll']['number'] = [0] * 2 * length
-        self.model['properties']['pitch']['number'] = [0] * 2 * length
-        self.model['properties']['heading']['number'] = [0] * 2 * length
+        # sampled properties are kept as interleaved numpy arrays (time, value, ...) and written straight to json text
+        self.position = np.zeros((length, 4), dtype=np.float64)
+        self.roll = np.zeros((length, 2), dtype=np.float64)
+        self.pitch = np.zeros((length, 2), dtype=np.float64)
+        self.heading = np.zeros((length, 2), dtype=np.float64)
+        # number of digits after the decimal point: time, longitude, latitude, altitude / time, angle
+        self.position_precisions = [0, coordinate_precision, coordinate_precision, altitude_precision]
+        self.angle_precisions = [0, angle_precision]
+        self.model['position']['cartographicDegrees'] = sampled_placeholder('position')
+        self.model['properties']['roll']['number'] = sampled_placeholder('roll')
+        self.model['properties']['pitch']['number'] = sampled_placeholder('pitch')
+        self.model['properties']['heading']['number'] = sampled_placeholder('heading')
 
     def set_with_df(self, df):
         self._set_time(*self._get_time_info(df['timestamp']))
-        self._set_position(df['longitude'], df['latitude'], df['altitude'])
-        self._set_orientation(df['roll'], df['pitch'], df['heading'])
+        self._set_position(df['longitude'].values, df['latitude'].values, df['altitude'].values)
+        self._set_orientation(df['roll'].values, df['pitch'].values, df['heading'].values)
 
     def _set_time(self, time_window, time_steps):
         [epoch, end] = time_window
-        self.model['availability'] = f"{epoch}/{end}"
+        if 'availability' in self.model:
+            self.model['availability'] = f"{epoch}/{end}"
         self.model['position']['epoch'] = epoch
-        self.model['position']['cartographicDegrees'][0::4] = time_steps
+        self.position[:, 0] = time_steps
         self.model['properties']['roll']['epoch'] = epoch
         self.model['properties']['pitch']['epoch'] = epoch
         self.model['properties']['heading']['epoch'] = epoch
-        self.model['properties']['roll']['number'][0::2] = time_steps
-        self.model['properties']['pitch']['number'][0::2] = time_steps
-        self.model['properties']['heading']['number'][0::2] = time_steps
+        self.roll[:, 0] = time_steps
+        self.pitch[:, 0] = time_steps
+        self.heading[:, 0] = time_steps
 
     def _set_position(self, longitude, latitude, altitude):
-        self.model['position']['cartographicDegrees'][1::4] = longitude
-        self.model['position']['cartographicDegrees'][2::4] = latitude
-        self.model['position']['cartographicDegrees'][3::4] = altitude
+        self.position[:, 1] = longitude
+        self.position[:, 2] = latitude
+        self.position[:, 3] = altitude
 
     def _set_orientation(self, roll, pitch, heading):
-        self.model['properties']['roll']['number'][1::2] = roll
-        self.model['properties']['pitch']['number'][1::2] = pitch
-        self.model['properties']['heading']['number'][1::2] = heading
+        self.roll[:, 1] = roll
+        self.pitch[:, 1] = pitch
+        self.heading[:, 1] = heading
 
     def _get_time_info(self, time):
         time = time.values.astype('datetime64[s]') # pandas series to numpy ndarray
         time_window = time[[0, -1]].astype(np.string_)  # get first and last element
         time_window = np.core.defchararray.add(time_window, np.string_('Z')) # add Z to each time window element to make it ISO format
         time_window = np.core.defchararray.decode(time_window, 'UTF-8') # decode to UTF-8 from byte_ object
-        time_steps = (time - time[0]).astype(int).tolist()
+        time_steps = (time - time[0]).astype(np.int64)
         return time_window, time_steps
 
+    def _iter_sampled_text(self, name, chunk_rows):
+        # json text of a sampled property, e.g. [t0,lon0,lat0,alt0,t1,lon1,...], formatted chunk_rows samples at a time
+        samples = getattr(self, name)
+        precisions = self.position_precisions if name == 'position' else self.angle_precisions
+        yield '['
+        for start in range(0, samples.shape[0], chunk_rows):
+            separator = ',' if start > 0 else ''
+            yield separator + format_rows(samples[start:start + chunk_rows].T, precisions)
+        yield ']'
+
+    def iter_czml(self, chunk_rows=65536):
+        """Yields the CZML document as text chunks, each holding at most chunk_rows samples."""
+        czml_string = json.dumps([self.czml_head, self.model])
+        placeholders = {json.dumps(sampled_placeholder(name)): name for name in ['position', 'roll', 'pitch', 'heading']}
+        position = 0
+        for placeholder in sorted(placeholders, key=czml_string.index):
+            placeholder_start = czml_string.index(placeholder)
+            yield czml_string[position:placeholder_start]
+            yield from self._iter_sampled_text(placeholders[placeholder], chunk_rows)
+            position = placeholder_start + len(placeholder)
+        yield czml_string[position:]
+
+    def iter_czml_bytes(self, chunk_rows=65536, compress=None):
+        """Yields the CZML document as utf-8 encoded chunks, gzip compressed when compress is gzip."""
+        if compress not in [None, 'gzip']:
+            raise ValueError("compress should be either None or gzip")
+        compressor = zlib.compressobj(wbits=16 + zlib.MAX_WBITS) if compress == 'gzip' else None
+        for chunk in self.iter_czml(chunk_rows):
+            chunk = chunk.encode('utf-8')
+            if compressor is not None:
+                chunk = compressor.compress(chunk)
+            if chunk:
+                yield chunk
+        if compressor is not None:
+            yield compressor.flush()
+
+    def write(self, outfile, chunk_rows=65536, compress=None):
+        """Writes the CZML document to a path or a binary file-like object (e.g. a socket file), chunk by chunk.
+
+        Args:
+            outfile (str or file-like object): destination.
+            chunk_rows (int): maximum number of samples formatted at a time.
+            compress (str): None or gzip.
+        """
+        if isinstance(outfile, (str, os.PathLike)):
+            with open(outfile, mode='wb') as output:
+                self.write(output, chunk_rows, compress)
+            return
+        for chunk in self.iter_czml_bytes(chunk_rows, compress):
+            outfile.write(chunk)
+
+    async def write_async(self, writer, chunk_rows=65536, compress=None):
+        """Writes the CZML document to an asyncio stream writer, chunk by chunk, waiting for the stream to drain."""
+        for chunk in self.iter_czml_bytes(chunk_rows, compress):
+            writer.write(chunk)
+            await writer.drain()
+
     def get_czml_string(self):
-        return json.dumps([self.czml_head, self.model])
+        return ''.join(self.iter_czml())
+
+
+def sampled_placeholder(name):
+    # stands for the samples of a property in the model, until they are written as json text
+    return '__{}_samples__'.format(name)
@@ -0,0 +1,177 @@
+import os
+import json
+import time
+import hashlib
+import numpy as np
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:
+    # no inter process locks (e.g. windows)
+    fcntl = None
+
+class Manifest:
+    """
+    A json file recording, for every output of a processing step (e.g. a zarr store or a tile),
+    the hash of what produced it (inputs and processing parameters) and the hashes of its files.
+
+    A rerun skips the outputs whose key did not change and whose files are still there, and
+    regenerates the others. Entries are saved as outputs complete, so an interrupted run resumes
+    where it stopped.
+
+    Example:
+        manifest = Manifest("temp/2015-11-10/olympex_CRS_20151110/manifest.json")
+        key = hash_params({"input": input_hash, "chunk": 262144})
+        if not manifest.is_current("zarr", key):
+            ... # write the zarr store
+            manifest.update("zarr", key, ["zarr"])
+            manifest.save()
+    """
+    def __init__(self, path, save_interval=5, base_dir=None):
+        self.path = path
+        # outputs are relative to base_dir, by default the folder of the manifest
+        self.base_dir = os.path.dirname(path) if base_dir is None else base_dir
+        self.save_interval = save_interval
+        self.last_save = 0
+        self.entries = {}
+        if os.path.exists(path):
+            try:
+                with open(path) as infile:
+                    self.entries = json.load(infile)["entries"]
+            except (ValueError, KeyError):
+                # unreadable manifest, everything is regenerated
+                self.entries = {}
+
+    def get(self, name):
+        return self.entries.get(name)
+
+    def is_current(self, name, key, verify=False):
+        """Returns True when the output name was produced from key and its files are still there.
+
+        Keyword arguments:
+        verify -- also compare the hashes of the files (default False, only their sizes are compared).
+        """
+        entry = self.entries.get(name)
+        if entry is None or entry["key"] != key:
+            return False
+        for output, (size, digest) in entry["outputs"].items():
+            path = os.path.join(self.base_dir, output)
+            if not os.path.exists(path) or path_size(path) != size:
+                return False
+            if verify and hash_path(path) != digest:
+                return False
+        return True
+
+    def update(self, name, key, outputs, **extra):
+        """Records output name, produced from key, with the hashes of its output files (relative to the manifest)."""
+        self.entries[name] = {
+            "key": key,
+            "outputs": {output: (path_size(os.path.join(self.base_dir, output)), hash_path(os.path.join(self.base_dir, output))) for output in outputs},
+            **extra
+        }
+
+    def invalidate(self, name):
+        self.entries.pop(name, None)
+
+    def save(self, force=True):
+        """Writes the manifest atomically. Without force, saves at most once every save_interval seconds."""
+        if not force and time.time() - self.last_save < self.save_interval:
+            return
+        temp_path = "{}.{}.tmp".format(self.path, os.getpid())
+        with open(temp_path, mode='w') as outfile:
+            json.dump({"entries": self.entries}, outfile)
+        os.replace(temp_path, self.path)
+        self.last_save = time.time()
+
+
+def open_lock(path, shared=False, blocking=True):
+    """Returns the open lock file path, locked for the processes of the machine, or None when not blocking and
+    another process holds the lock. Closing the file releases the lock. Without fcntl, nothing is locked.
+
+    Args:
+        path (str): lock file, created when missing.
+        shared (bool): shared lock, held by several readers at a time (default False, exclusive).
+        blocking (bool): wait for the lock (default True).
+    """
+    if fcntl is None:
+        return open(os.devnull)
+    operation = fcntl.LOCK_SH if shared else fcntl.LOCK_EX
+    if not blocking:
+        operation |= fcntl.LOCK_NB
+    while True:
+        lock_file = open(path, mode="a")
+        try:
+            fcntl.flock(lock_file.fileno(), operation)
+        except BlockingIOError:
+            lock_file.close()
+            return None
+        except BaseException:
+            lock_file.close()
+            raise
+        # the lock file may have been removed (see remove_lock) while waiting for it, then the lock is stale
+        try:
+            if os.stat(path).st_ino == os.fstat(lock_file.fileno()).st_ino:
+                return lock_file
+        except FileNotFoundError:
+            pass
+        lock_file.close()
+
+
+def remove_lock(path):
+    """Removes a lock file, while holding its exclusive lock: the processes waiting on it then lock a new one."""
+    if fcntl is not None:
+        os.remove(path)
+
+
+@contextmanager
+def file_lock(path):
+    """Holds an exclusive lock on the file path, shared by the processes of the machine, e.g. while publishing an output."""
+    lock_file = open_lock(path)
+    try:
+        yield
+    finally:
+        lock_file.close()
+
+
+def hash_params(params):
+    """Returns the hash of a json serializable dict."""
+    return hashlib.sha256(json.dumps(params, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def hash_arrays(*arrays):
+    """Returns the hash of the content, dtype and shape of numpy arrays."""
+    digest = hashlib.sha256()
+    for array in arrays:
+        array = np.ascontiguousarray(array)
+        digest.update("{}{}".format(array.dtype.str, array.shape).encode())
+        digest.update(array)
+    return digest.hexdigest()
+
+
+def hash_file(path, block_size=1 << 20):
+    digest = hashlib.sha256()
+    with open(path, mode='rb') as infile:
+        for block in iter(lambda: infile.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def hash_path(path):
+    """Returns the hash of a file, or of the relative paths and contents of the files of a directory."""
+    if not os.path.isdir(path):
+        return hash_file(path)
+    digest = hashlib.sha256()
+    for directory, _, filenames in sorted(os.walk(path)):
+        for filename in sorted(filenames):
+            file_path = os.path.join(directory, filename)
+            digest.update(os.path.relpath(file_path, path).encode())
+            digest.update(hash_file(file_path).encode())
+    return digest.hexdigest()
+
+
+def path_size(path):
+    """Returns the size of a file, or the total size of the files of a directory."""
+    if not os.path.isdir(path):
+        return os.path.getsize(path)
+    return sum(os.path.getsize(os.path.join(directory, filename)) for directory, _, filenames in os.walk(path) for filename in filenames)
@@ -0,0 +1,153 @@
+import os
+import hashlib
+
+from .manifest import open_lock, remove_lock
+from .s3_io import get_s3_client, get_s3_details, head_s3, read_s3
+
+default_cache_dir = os.path.join(os.path.expanduser("~"), ".cache", "fcx_playground")
+default_max_size = 20 * 1024 ** 3
+
+
+class CacheEntry:
+    """
+    A cached s3 object, in use until released: other processes do not evict it while it is being read.
+
+    Args:
+        path (str): local path of the object.
+        etag (str): ETag of the object.
+        lock_file: open lock file of the entry, shared locked (default None, no inter process locks).
+    """
+    def __init__(self, path, etag, lock_file=None):
+        self.path = path
+        self.etag = etag
+        self.lock_file = lock_file
+
+    def release(self):
+        if self.lock_file is not None:
+            self.lock_file.close()
+            self.lock_file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.release()
+
+
+class S3Cache:
+    """
+    A local on-disk cache of s3 objects, so reprocessing an input (e.g. after changing a tiling parameter)
+    reads it from disk instead of downloading it again.
+
+    Entries are keyed by the hash of bucket/key/ETag: a changed object is a new entry, and the old one
+    ages out. When the cache grows over max_size, the least recently used entries are removed.
+    Entries are downloaded to a temporary file and renamed into place, and the processes sharing the
+    cache folder lock an entry while downloading it, so an object is downloaded once and never read half written.
+    The entries returned by get are shared locked until released, eviction skips them.
+
+    Args:
+        cache_dir (str): cache folder (default: the FCX_CACHE_DIR environment variable, or ~/.cache/fcx_playground).
+        max_size (int): size cap of the cache, in bytes (default: the FCX_CACHE_MAX_SIZE environment variable, or 20 GiB).
+
+    Example:
+        with S3Cache().get("s3://bucket/olympex_CRS_20151110_....nc") as entry:
+            data = xr.open_dataset(entry.path)
+            ...
+    """
+    def __init__(self, cache_dir=None, max_size=None):
+        self.cache_dir = cache_dir or os.environ.get("FCX_CACHE_DIR", default_cache_dir)
+        self.max_size = int(max_size if max_size is not None else os.environ.get("FCX_CACHE_MAX_SIZE", default_max_size))
+        self.entries_dir = os.path.join(self.cache_dir, "entries")
+        self.temp_dir = os.path.join(self.cache_dir, "tmp")
+        self.locks_dir = os.path.join(self.cache_dir, "locks")
+        for folder in [self.entries_dir, self.temp_dir, self.locks_dir]:
+            os.makedirs(folder, exist_ok=True)
+
+    def get(self, url, client=None):
+        """Returns the CacheEntry of an s3 object, downloading it when it is not cached yet.
+        The entry is not evicted until it is released."""
+        client = client or get_s3_client()
+        _, etag = head_s3(url, client)
+        name = self._entry_name(url, etag)
+        path = os.path.join(self.entries_dir, name)
+        while True:
+            lock_file = self._open_lock(name, shared=True)
+            if os.path.exists(path):
+                break
+            # downloaded under an exclusive lock, then read under a shared one
+            self._unlock(lock_file)
+            lock_file = self._open_lock(name)
+            try:
+                if not os.path.exists(path):
+                    s3_file = read_s3(url, client, spill_dir=self.temp_dir)
+                    os.replace(s3_file.path, path)
+            finally:
+                self._unlock(lock_file)
+        # most recently used
+        os.utime(path)
+        entry = CacheEntry(path, etag, lock_file)
+        try:
+            self.evict()
+        except BaseException:
+            entry.release()
+            raise
+        return entry
+
+    def evict(self):
+        """Removes the least recently used entries, until the cache is under its size cap.
+        Entries in use, by this process or another one, are kept."""
+        lock_file = self._open_lock("evict")
+        try:
+            entries = []
+            for name in os.listdir(self.entries_dir):
+                try:
+                    stat = os.stat(os.path.join(self.entries_dir, name))
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, name))
+            size = sum(entry_size for _, entry_size, _ in entries)
+            for _, entry_size, name in sorted(entries):
+                if size <= self.max_size:
+                    break
+                entry_lock_file = self._open_lock(name, blocking=False)
+                if entry_lock_file is None:
+                    # in use
+                    continue
+                try:
+                    os.remove(os.path.join(self.entries_dir, name))
+                    # the lock file goes with its entry, see manifest.remove_lock for the processes still waiting on it
+                    self._remove_lock(name)
+                finally:
+                    self._unlock(entry_lock_file)
+                size -= entry_size
+        finally:
+            self._unlock(lock_file)
+
+    def clear(self):
+        self.max_size, max_size = 0, self.max_size
+        try:
+            self.evict()
+        finally:
+            self.max_size = max_size
+
+    def _entry_name(self, url, etag):
+        bucket_name, object_key = get_s3_details(url)
+        digest = hashlib.sha256("{}/{}/{}".format(bucket_name, object_key, etag).encode()).hexdigest()
+        # the extension is kept, readers pick their engine from it (e.g. netcdf)
+        return digest + os.path.splitext(object_key)[1]
+
+    def _lock_path(self, name):
+        return os.path.join(self.locks_dir, name + ".lock")
+
+    def _open_lock(self, name, shared=False, blocking=True):
+        """Returns the open, locked, lock file of name, or None when not blocking and it is locked by someone else.
+        Without inter process locks (e.g. windows), the cache is only safe for one process at a time."""
+        return open_lock(self._lock_path(name), shared=shared, blocking=blocking)
+
+    def _unlock(self, lock_file):
+        if lock_file is not None:
+            # closing the file releases its lock
+            lock_file.close()
+
+    def _remove_lock(self, name):
+        remove_lock(self._lock_path(name))
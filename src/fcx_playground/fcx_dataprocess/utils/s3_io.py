@@ -0,0 +1,141 @@
+import os
+import random
+import tempfile
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+import boto3
+from botocore.config import Config
+from botocore.exceptions import BotoCoreError, ClientError
+
+# objects are downloaded in parts of part_size bytes, workers parts at a time
+part_size = 8 * 1024 * 1024
+workers = 8
+# attempts of a part (request and body), before giving up
+max_attempts = 5
+backoff = 0.5
+
+# http errors worth retrying, other client errors (e.g. missing key, changed object) fail right away
+retryable_status_codes = {408, 429, 500, 502, 503, 504}
+
+# one client per process and endpoint, boto3 clients are thread safe but not fork safe
+_clients = {}
+_clients_lock = threading.Lock()
+
+# downloaded object: data holds the content in memory, or path the spill file it was written to
+S3Object = namedtuple("S3Object", ["url", "etag", "size", "data", "path"])
+
+
+def get_s3_client(endpoint_url=None, max_pool_connections=32):
+    """Returns the s3 client shared by the process, with a connection pool and botocore's retries.
+
+    Args:
+        endpoint_url (str): s3 compatible endpoint, e.g. a local moto server (default: aws, or the AWS_ENDPOINT_URL environment variable).
+        max_pool_connections (int): size of the connection pool, at least the number of parts downloaded at a time.
+    """
+    key = (os.getpid(), endpoint_url, max_pool_connections)
+    with _clients_lock:
+        if key not in _clients:
+            config = Config(max_pool_connections=max_pool_connections, retries={"max_attempts": max_attempts, "mode": "standard"})
+            # a session per client, the default session is not thread safe
+            _clients[key] = boto3.session.Session().client("s3", endpoint_url=endpoint_url, config=config)
+        return _clients[key]
+
+
+def get_s3_details(url):
+    """Returns the bucket and the key of an s3://bucket/key url."""
+    url = url.replace("s3://", "")
+    bucket_name, _, object_key = url.partition("/")
+    return bucket_name, object_key
+
+
+def head_s3(url, client=None):
+    """Returns the size and the ETag of an s3 object."""
+    client = client or get_s3_client()
+    bucket_name, object_key = get_s3_details(url)
+    head = _with_retries(lambda: client.head_object(Bucket=bucket_name, Key=object_key))
+    return head["ContentLength"], head["ETag"]
+
+
+def open_s3(url, client=None):
+    """Returns the streaming body and the ETag of an s3 object, to be read sequentially (e.g. by a csv parser)."""
+    client = client or get_s3_client()
+    bucket_name, object_key = get_s3_details(url)
+    s3_file = _with_retries(lambda: client.get_object(Bucket=bucket_name, Key=object_key))
+    return s3_file["Body"], s3_file["ETag"]
+
+
+def read_s3(url, client=None, spill_dir=None, part_size=part_size, workers=workers):
+    """Downloads an s3 object with parallel ranged GETs, each part retried with exponential backoff.
+
+    Parts are requested with the ETag of the object, so a change of the object during the download
+    fails the download instead of mixing two versions.
+
+    Args:
+        url (str): s3://bucket/key url.
+        client: boto3 s3 client (default: the shared client of get_s3_client).
+        spill_dir (str): folder of the spill file the object is written to, instead of memory (default None, in memory).
+            The caller removes the spill file once done with it.
+        part_size (int): size of the ranged GETs, in bytes.
+        workers (int): number of parts downloaded at a time.
+
+    Returns:
+        S3Object: data (bytes) when downloaded in memory, path when spilled to a file.
+    """
+    client = client or get_s3_client()
+    bucket_name, object_key = get_s3_details(url)
+    size, etag = head_s3(url, client)
+    ranges = [(start, min(start + part_size, size) - 1) for start in range(0, size, part_size)]
+
+    def get_part(byte_range):
+        def request():
+            s3_file = client.get_object(Bucket=bucket_name, Key=object_key, IfMatch=etag, Range="bytes={}-{}".format(*byte_range))
+            return s3_file["Body"].read()
+        return _with_retries(request)
+
+    if spill_dir is None:
+        data = b"".join(_map_parts(get_part, ranges, workers))
+        return S3Object(url, etag, size, data, None)
+
+    os.makedirs(spill_dir, exist_ok=True)
+    descriptor, path = tempfile.mkstemp(dir=spill_dir, suffix=os.path.splitext(object_key)[1])
+    try:
+        with os.fdopen(descriptor, mode="r+b") as outfile:
+            outfile.truncate(size)
+
+            def write_part(byte_range):
+                os.pwrite(outfile.fileno(), get_part(byte_range), byte_range[0])
+
+            _map_parts(write_part, ranges, workers)
+    except BaseException:
+        os.remove(path)
+        raise
+    return S3Object(url, etag, size, None, path)
+
+
+def _map_parts(function, ranges, workers):
+    # returns the results of function on every part, in order. The first failure cancels the parts not started yet.
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(function, byte_range) for byte_range in ranges]
+        try:
+            return [future.result() for future in futures]
+        except BaseException:
+            for future in futures:
+                future.cancel()
+            raise
+
+
+def _with_retries(request):
+    # retries the errors botocore does not retry itself, e.g. a connection dropped while reading a body
+    for attempt in range(max_attempts):
+        try:
+            return request()
+        except (BotoCoreError, ClientError) as e:
+            if isinstance(e, ClientError) and e.response.get("ResponseMetadata", {}).get("HTTPStatusCode") not in retryable_status_codes:
+                raise
+            if attempt == max_attempts - 1:
+                raise
+            # exponential backoff with jitter
+            time.sleep(backoff * (2 ** attempt) * (0.5 + random.random()))
@@ -0,0 +1,184 @@
+import os
+import gzip
+from concurrent.futures import ThreadPoolExecutor
+
+from .manifest import hash_file, hash_params
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Content-Encoding of the sidecars, with their file extension and default level
+#   gzip: standard library, level 1 to 9.
+#   br: needs the brotli package, quality 0 to 11. Qualities above 9 are much slower for little gain.
+content_encodings = {
+    "gzip": {"extension": ".gz", "level": 6},
+    "br": {"extension": ".br", "level": 6}
+}
+
+
+def compress_bytes(data, encoding="gzip", level=None):
+    """Returns data compressed with a content encoding, gzip or br."""
+    level = content_encodings[encoding]["level"] if level is None else level
+    if encoding == "br":
+        return brotli.compress(data, quality=level)
+    # no timestamp in the header, so the same tile always gives the same sidecar
+    return gzip.compress(data, compresslevel=level, mtime=0)
+
+
+def sidecar_path(path, encoding):
+    return path + content_encodings[encoding]["extension"]
+
+
+def compress_file(path, encoding="gzip", level=None):
+    """Writes the sidecar path.gz (or path.br) of a file. Returns the sidecar path."""
+    sidecar = sidecar_path(path, encoding)
+    with open(path, mode='rb') as infile:
+        data = compress_bytes(infile.read(), encoding, level)
+    # written aside then moved, so a server never reads a partial sidecar
+    temp_path = "{}.{}.tmp".format(sidecar, os.getpid())
+    with open(temp_path, mode='wb') as outfile:
+        outfile.write(data)
+    os.replace(temp_path, sidecar)
+    return sidecar
+
+
+def is_tile_output(filename):
+    return filename.endswith(".pnts") or filename.endswith("tileset.json")
+
+
+def tile_output_files(point_cloud_folder):
+    """Returns the paths of the .pnts tiles and tileset json files of a point cloud folder."""
+    return [os.path.join(point_cloud_folder, filename) for filename in sorted(os.listdir(point_cloud_folder))
+            if is_tile_output(filename)]
+
+
+def remove_stale_sidecars(point_cloud_folder, encodings, manifest=None):
+    """Removes the sidecars of a point cloud folder that this run does not produce, once the tiles are generated and
+    before they are compressed: the sidecars of the other content encodings (e.g. all of them without compression),
+    and the ones of files no longer written. The sidecars of the raw files are then compressed again by compress_tiles
+    when their content changed.
+
+    Args:
+        point_cloud_folder (string): folder written by write_tiles.
+        encodings (list): content encodings of the sidecars of this run, see compression_settings.
+        manifest (Manifest): manifest of the tiles of point_cloud_folder (default None). The sidecar entries of the
+            removed files are dropped, and the tiles recording their sidecars only (keep_raw False) keep them.
+
+    Returns:
+        list: paths of the sidecars removed.
+    """
+    recorded = set()
+    if manifest is not None:
+        recorded = {output for name, entry in manifest.entries.items() if name.startswith("tile/") for output in entry["outputs"]}
+    removed = []
+    for filename in sorted(os.listdir(point_cloud_folder)):
+        for encoding, content_encoding in content_encodings.items():
+            raw_filename = filename[:-len(content_encoding["extension"])]
+            if filename.endswith(content_encoding["extension"]) and is_tile_output(raw_filename):
+                break
+        else:
+            continue
+        raw_written = os.path.exists(os.path.join(point_cloud_folder, raw_filename))
+        if encoding in encodings and (raw_written or filename in recorded):
+            continue
+        os.remove(os.path.join(point_cloud_folder, filename))
+        removed.append(os.path.join(point_cloud_folder, filename))
+        if manifest is not None:
+            manifest.invalidate("sidecar/{}".format(filename))
+    return removed
+
+
+def compression_settings(encodings, level, keep_raw):
+    """Returns the compression settings of a run, as recorded in the manifest."""
+    if isinstance(encodings, str):
+        encodings = [encodings]
+    encodings = sorted(encodings or [])
+    # without sidecars, the raw files are always kept
+    return {"encodings": encodings, "level": level, "keep_raw": keep_raw or not encodings}
+
+
+def check_compression(manifest, settings):
+    """Invalidates the tiles of the manifest that cannot be reused with the compression settings of this run,
+    before the tiles are generated: the tiles of a previous run that did not keep the raw files, with other settings
+    (their sidecars have to be compressed again, from new raw files)."""
+    previous = manifest.get("compression")
+    if previous is None or previous["settings"]["keep_raw"] or previous["settings"] == settings:
+        return
+    for name in [name for name in manifest.entries if name.startswith("tile/")]:
+        manifest.invalidate(name)
+
+
+def compress_tiles(point_cloud_folder, encodings=("gzip",), level=None, workers=10, keep_raw=True, manifest=None):
+    """Writes pre-compressed sidecars of the tiles and tileset json files of a point cloud folder,
+    e.g. 0_1.pnts.gz next to 0_1.pnts, to be served as is with a Content-Encoding header.
+
+    With a manifest, a sidecar is only compressed again when the content of its file, or the level, changed.
+    Without the raw files, the manifest entries of the tiles record their sidecars instead, so incremental reruns
+    with the same settings still skip them.
+
+    Args:
+        point_cloud_folder (string): folder written by write_tiles.
+        encodings (list): content encodings of the sidecars, gzip and/or br (default gzip).
+        level (int): compression level (default None, the default level of each encoding, see content_encodings).
+        workers (int): number of threads compressing the files (default 10). zlib and brotli release the GIL.
+        keep_raw (bool): keep the uncompressed files (default True).
+        manifest (Manifest): manifest of the tiles of point_cloud_folder (default None, every sidecar is compressed).
+
+    Returns:
+        list: paths of the sidecars written.
+    """
+    settings = compression_settings(encodings, level, keep_raw)
+    for encoding in settings["encodings"]:
+        if encoding not in content_encodings:
+            raise ValueError("encodings should be in {}".format(list(content_encodings)))
+        if encoding == "br" and brotli is None:
+            raise ValueError("br encoding needs the brotli package")
+
+    paths = tile_output_files(point_cloud_folder)
+    tasks = []
+    for path in paths:
+        file_hash = hash_file(path) if manifest is not None else None
+        for encoding in settings["encodings"]:
+            name = "sidecar/{}".format(os.path.basename(sidecar_path(path, encoding)))
+            key = hash_params({"file": file_hash, "encoding": encoding, "level": level})
+            if manifest is not None and manifest.is_current(name, key):
+                continue
+            tasks.append((path, encoding, name, key))
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        sidecars = list(pool.map(lambda task: compress_file(task[0], task[1], level), tasks))
+
+    if manifest is not None:
+        for (_, _, name, key), sidecar in zip(tasks, sidecars):
+            manifest.update(name, key, [os.path.basename(sidecar)])
+        if not keep_raw:
+            record_sidecars(manifest, settings["encodings"])
+        manifest.save()
+
+    if not keep_raw:
+        for path in paths:
+            os.remove(path)
+    return sidecars
+
+
+def record_sidecars(manifest, encodings):
+    # the tiles are then current as long as their sidecars are there
+    extensions = tuple(content_encoding["extension"] for content_encoding in content_encodings.values())
+    for name, entry in list(manifest.entries.items()):
+        if not name.startswith("tile/") or all(output.endswith(extensions) for output in entry["outputs"]):
+            continue
+        outputs = []
+        for output in entry["outputs"]:
+            if output.endswith(extensions):
+                outputs.append(output)
+            else:
+                outputs.extend(sidecar_path(output, encoding) for encoding in encodings)
+        extra = {field: value for field, value in entry.items() if field not in ("key", "outputs")}
+        manifest.update(name, entry["key"], outputs, **extra)
+
+
+def record_compression(manifest, settings):
+    """Records the compression settings of a run, see check_compression."""
+    manifest.update("compression", hash_params(settings), [], settings=settings)
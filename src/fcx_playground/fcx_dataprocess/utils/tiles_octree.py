@@ -0,0 +1,156 @@
+import json
+import numpy as np
+from datetime import datetime
+from copy import deepcopy
+
+from .tiles_model import tileset_json
+from .tiles_point_cloud import executors, cartographic_to_cartesian, write_pnts, get_encoding, value_encoding
+from .tiles_quantize import geodetic_to_ecef
+
+to_rad = np.pi / 180.0
+
+# approximate length of a degree, in meters
+meters_per_degree = 111320.0
+
+class OctreePointCloud:
+    """
+    Writes a spatially partitioned 3D Tiles point cloud, as an alternative to the time-slice LOD chain of PointCloud.
+
+    The points are split into an adaptive octree: a node is split along its axes that are at least half as long
+    (in meters) as its longest axis, so thin curtains are split like a quadtree. Every node holds an evenly strided
+    subset of its points and its children hold the rest (refine ADD), so no point is stored twice.
+    Each node gets a tight bounding region and a geometric error estimated from the spacing of its points,
+    which lets Cesium cull and refine region by region.
+
+    Args:
+        key (string): destination folder.
+        lon, lat, alt, value, time (numpy.ndarray): point data, time relative to epoch.
+        epoch (int): unix time of the first point.
+        max_points (int): maximum number of points per tile (default 100000).
+        max_depth (int): maximum depth of the tree, deeper nodes become leaves whatever their size (default 12).
+        workers (int): number of workers writing the tiles (default 10).
+        executor (string): either thread or process (default thread).
+        ecef (numpy.ndarray): (N, 3) earth centered positions of the points, see tiles_quantize.geodetic_to_ecef (default None, computed here).
+        encoding (string or dict): attribute encoding of the tiles, see tiles_point_cloud.encodings (default default).
+    """
+    def __init__(self, key, lon, lat, alt, value, time, epoch, max_points=100000, max_depth=12, workers=10, executor="thread", ecef=None, encoding="default"):
+        if executor not in executors:
+            raise ValueError("executor should be one of {}".format(list(executors)))
+        self.key = key
+        self.lon = lon
+        self.lat = lat
+        self.alt = alt
+        self.time = time
+        self.value = value
+        self.epoch = epoch
+        self.max_points = max_points
+        self.max_depth = max_depth
+        self.workers = workers
+        self.executor = executor
+        self.ecef = geodetic_to_ecef(lon, lat, alt) if ecef is None else ecef
+        self.encoding = get_encoding(encoding)
+        self.value_encoding = value_encoding(value, self.encoding)
+        self.tasks = []
+        self.futures = []
+        self.pool = None
+        self.tileset_json = deepcopy(tileset_json)
+        self.tileset_json["properties"]["epoch"] = "{}Z".format(datetime.utcfromtimestamp(epoch).isoformat())
+        if self.value_encoding is not None:
+            self.tileset_json["extras"] = {"value": self.value_encoding}
+
+
+    def start(self):
+        root = self.build(np.arange(self.time.size), "0", 0, self.tileset_json["root"]["geometricError"])
+        self.tileset_json["root"] = root
+        self.pool = executors[self.executor](max_workers=self.workers)
+        for filename, idx in self.tasks:
+            self.futures.append(self.pool.submit(write_node, '{}/{}'.format(self.key, filename),
+                self.lon[idx], self.lat[idx], self.alt[idx], self.value[idx], self.time[idx], self.ecef[idx],
+                self.encoding, self.value_encoding))
+        self.tasks = []
+
+
+    def join(self):
+        try:
+            for future in self.futures:
+                future.result()
+        finally:
+            self.pool.shutdown()
+            self.futures = []
+
+        with open('{}/tileset.json'.format(self.key), mode='w+') as outfile:
+            json.dump(self.tileset_json, outfile)
+
+
+    def build(self, idx, address, depth, parent_error):
+        """Returns the tileset.json node of the points idx, schedules the tiles of the node and its descendants."""
+        lon = self.lon[idx]
+        lat = self.lat[idx]
+        alt = self.alt[idx]
+        time = self.time[idx]
+
+        lower = np.array([np.min(lon), np.min(lat), np.min(alt)], dtype=np.float64)
+        upper = np.array([np.max(lon), np.max(lat), np.max(alt)], dtype=np.float64)
+        extent = (upper - lower) * [meters_per_degree * np.cos(np.mean(lat) * to_rad), meters_per_degree, 1]
+        diagonal = float(np.sqrt(np.sum(np.square(extent))))
+
+        epoch = "{}Z".format(datetime.utcfromtimestamp(int(np.min(time) + self.epoch - 300)).isoformat())
+        end = "{}Z".format(datetime.utcfromtimestamp(int(np.max(time) + self.epoch + 300)).isoformat())
+
+        filename = "{}.pnts".format(address)
+        node = {
+            "availability": "{}/{}".format(epoch, end),
+            "geometricError": 0,
+            "boundingVolume": {
+                "region": [
+                    float(lower[0]) * to_rad,
+                    float(lower[1]) * to_rad,
+                    float(upper[0]) * to_rad,
+                    float(upper[1]) * to_rad,
+                    float(lower[2]),
+                    float(upper[2])
+                ]
+            },
+            "content": {
+                "uri": filename
+            },
+            "refine": "ADD"
+        }
+
+        if idx.size <= self.max_points or depth >= self.max_depth:
+            self.tasks.append((filename, idx))
+            return node
+
+        # evenly strided subset for this node, the rest goes to the children
+        keep = np.zeros(idx.size, dtype=bool)
+        keep[::int(np.ceil(idx.size / self.max_points))] = True
+        self.tasks.append((filename, idx[keep]))
+
+        # geometric error: average spacing of the points of this node, over its (mostly 2d) curtain
+        geometric_error = min(diagonal / np.sqrt(np.count_nonzero(keep)), parent_error)
+        node["geometricError"] = geometric_error
+
+        # child index of every remaining point, one bit per split axis
+        rest = ~keep
+        middle = (lower + upper) / 2
+        code = np.zeros(np.count_nonzero(rest), dtype=np.uint8)
+        bit = 0
+        for axis, coordinate in enumerate([lon, lat, alt]):
+            if extent[axis] > 0 and extent[axis] >= np.max(extent) / 2:
+                code |= (coordinate[rest] > middle[axis]).astype(np.uint8) << bit
+                bit += 1
+
+        children_idx = idx[rest]
+        order = np.argsort(code, kind="stable")
+        codes, counts = np.unique(code[order], return_counts=True)
+        node["children"] = []
+        for child_code, child_idx in zip(codes, np.split(children_idx[order], np.cumsum(counts)[:-1])):
+            address_child = "{}-{}".format(address, child_code)
+            node["children"].append(self.build(child_idx, address_child, depth + 1, geometric_error))
+
+        return node
+
+
+def write_node(path, lon, lat, alt, value, time, ecef=None, encoding=None, value_encoding=None):
+    cartesian, offset, scale, cartographic, _ = cartographic_to_cartesian(lon, lat, alt, ecef)
+    return write_pnts(path, cartesian, offset, scale, value, time, cartographic, encoding, value_encoding)
@@ -0,0 +1,123 @@
+import json
+import numpy as np
+
+header_length = 28
+magic = b"pnts"
+version = 1
+
+class PntsEncoder:
+    """
+    Encodes a 3D Tiles point cloud (.pnts) tile into a single preallocated buffer.
+
+    The binary properties are registered with their source arrays, which can be strided views
+    (e.g. cartesian[::step]). They are cast and copied once, straight into their place in the tile buffer.
+    The byte offsets of the properties inside the feature and batch table binaries are computed by the encoder.
+
+    Example:
+        encoder = PntsEncoder()
+        encoder.feature_table["POINTS_LENGTH"] = length
+        encoder.add_feature_property("POSITION_QUANTIZED", cartesian[::step], np.uint16)
+        encoder.feature_table["QUANTIZED_VOLUME_OFFSET"] = offset
+        encoder.feature_table["QUANTIZED_VOLUME_SCALE"] = scale
+        encoder.add_batch_property("value", value[::step], np.float32, componentType="FLOAT", type="SCALAR")
+        encoder.write("0_1.pnts")
+    """
+    def __init__(self):
+        self.feature_table = {}
+        self.batch_table = {}
+        self.feature_arrays = []
+        self.batch_arrays = []
+        self.feature_table_binary_byte_length = 0
+        self.batch_table_binary_byte_length = 0
+
+    def add_feature_property(self, name, array, dtype, **properties):
+        offset = self._aligned(self.feature_table_binary_byte_length, dtype)
+        self.feature_table[name] = {"byteOffset": offset, **properties}
+        self.feature_arrays.append((offset, array, dtype))
+        self.feature_table_binary_byte_length = offset + np.dtype(dtype).itemsize * array.size
+
+    def add_batch_property(self, name, array, dtype, **properties):
+        offset = self._aligned(self.batch_table_binary_byte_length, dtype)
+        self.batch_table[name] = {"byteOffset": offset, **properties}
+        self.batch_arrays.append((offset, array, dtype))
+        self.batch_table_binary_byte_length = offset + np.dtype(dtype).itemsize * array.size
+
+    def encode(self):
+        """Returns the tile as a bytearray."""
+        tile_length = header_length
+
+        feature_table_json = padded_json(self.feature_table, tile_length)
+        tile_length += len(feature_table_json)
+        feature_table_binary_start = tile_length
+        tile_length += self.feature_table_binary_byte_length
+        feature_table_padding = padding(tile_length)
+        tile_length += feature_table_padding
+
+        batch_table_json = b""
+        if self.batch_table:
+            batch_table_json = padded_json(self.batch_table, tile_length)
+        tile_length += len(batch_table_json)
+        batch_table_binary_start = tile_length
+        tile_length += self.batch_table_binary_byte_length
+        batch_table_padding = padding(tile_length)
+        if not self.batch_table:
+            batch_table_padding = 0
+        tile_length += batch_table_padding
+
+        buffer = bytearray(tile_length)
+        buffer[0:4] = magic
+        header = np.ndarray(shape=(6,), dtype="<u4", buffer=buffer, offset=4)
+        header[:] = [
+            version,
+            tile_length,
+            len(feature_table_json),
+            self.feature_table_binary_byte_length + feature_table_padding,
+            len(batch_table_json),
+            self.batch_table_binary_byte_length + batch_table_padding
+        ]
+
+        buffer[header_length:feature_table_binary_start] = feature_table_json
+        for offset, array, dtype in self.feature_arrays:
+            copy_into(buffer, feature_table_binary_start + offset, array, dtype)
+        feature_table_end = feature_table_binary_start + self.feature_table_binary_byte_length
+        buffer[feature_table_end:feature_table_end + feature_table_padding] = b" " * feature_table_padding
+
+        buffer[feature_table_end + feature_table_padding:batch_table_binary_start] = batch_table_json
+        for offset, array, dtype in self.batch_arrays:
+            copy_into(buffer, batch_table_binary_start + offset, array, dtype)
+        buffer[tile_length - batch_table_padding:] = b" " * batch_table_padding
+
+        return buffer
+
+    def write(self, path):
+        """Encodes the tile and writes it to path with a single write."""
+        buffer = self.encode()
+        with open(path, mode='wb') as outfile:
+            outfile.write(buffer)
+        return len(buffer)
+
+    def _aligned(self, offset, dtype):
+        # binary properties start at a multiple of their component size
+        itemsize = np.dtype(dtype).itemsize
+        return -(-offset // itemsize) * itemsize
+
+
+def padded_json(table, offset):
+    # minified json, padded with spaces so that the binary following it is 8-byte aligned
+    table_json = json.dumps(table, separators=(",", ":")) + "       "
+    trim = (offset + len(table_json)) % 8
+    if trim != 0:
+        table_json = table_json[:-trim]
+    return table_json.encode()
+
+
+def padding(length):
+    # number of bytes to reach the next 8-byte boundary
+    remainder = length % 8
+    return 0 if remainder == 0 else 8 - remainder
+
+
+def copy_into(buffer, offset, array, dtype):
+    # cast and copy array into buffer at offset, in a single pass
+    view = np.ndarray(shape=array.shape, dtype=np.dtype(dtype).newbyteorder("<"), buffer=buffer, offset=offset)
+    np.copyto(view, array, casting="unsafe")
@@ -1,18 +1,95 @@
+import os
+import re
 import json
 import numpy as np
 from datetime import datetime
-from threading import Thread, Lock
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed
 from copy import deepcopy
 
 from .tiles_model import tileset_json
+from .tiles_pnts import PntsEncoder
+from .manifest import hash_arrays, hash_params
+from .tiles_quantize import geodetic_to_ecef, quantize_positions, quantize_cartographic, tile_region
 
 to_rad = np.pi / 180.0
 to_deg = 180.0 / np.pi
 
 steps = [32, 16, 8, 4, 2, 1]
 
+refinements = ["REPLACE", "ADD"]
+
+# layouts of the tileset json files
+#   monolithic: one tileset.json holding the levels of detail of every tile.
+#   external: one <tile>_tileset.json per tile, holding its levels of detail and its refined files.
+#       The tileset.json only lists the tiles, so its size and parse time grow slowly with the number of points.
+tileset_layouts = ["monolithic", "external"]
+
+# <tile>_tileset.json files of the external layout, and their pre-compressed sidecars
+external_tileset_pattern = re.compile(r"^(\d+_tileset\.json)(\.gz|\.br)?$")
+
+executors = {
+    "thread": ThreadPoolExecutor,
+    "process": ProcessPoolExecutor
+}
+
+# attribute encodings of the .pnts tiles
+#   batch_id: write a BATCH_ID per point. Without it, the batch table holds one entry per point, as allowed by the spec.
+#   value: float32, or uint16/uint8 quantized over the value range of the whole point cloud,
+#       decoded as value * scale + offset (scale and offset in the extras of the batch table and of the tileset.json).
+#   time: float32, or uint16 seconds from the first time of the tile, in the extras of the batch table
+#       (uint32 when a tile spans more than 65535 seconds).
+#   location: write the int16 cartographic location of every point, e.g. for picking. Opt-in with the compact encoding,
+#       e.g. encoding={**encodings["compact"], "location": True}.
+encodings = {
+    "default": {"batch_id": True, "value": "float32", "time": "float32", "location": True},
+    "compact": {"batch_id": False, "value": "uint16", "time": "uint16", "location": False}
+}
+
+value_types = {
+    "uint8": (np.uint8, "UNSIGNED_BYTE"),
+    "uint16": (np.uint16, "UNSIGNED_SHORT")
+}
+
 class PointCloud:
-    def __init__(self, key, lon, lat, alt, value, time, epoch):
+    """
+    Writes the .pnts tiles and the tileset.json of a point cloud, one tile per scheduled (start, end) slice.
+
+    Tiles are generated by a pool of workers fed through the executor task queue. Every tile returns its
+    own tileset.json fragment, the fragments are merged into the tileset.json in join.
+
+    With a manifest, the tiles whose points and parameters did not change since they were last written are
+    not generated again, and the manifest is updated as the other tiles complete.
+
+    Args:
+        key (string): destination folder.
+        lon, lat, alt, value, time (numpy.ndarray): point data, time relative to epoch.
+        epoch (int): unix time of the first point.
+        workers (int): number of workers generating the tiles (default 10).
+        executor (string): either thread or process (default thread).
+            process workers do not share the GIL, the tile data is sent to them when the tile is scheduled.
+        refine (string): either REPLACE or ADD (default REPLACE).
+            REPLACE: every level of detail holds every step-th point of the tile, including the points of the coarser levels.
+            ADD: every level of detail only holds the points that the coarser levels do not have.
+        manifest (Manifest): manifest of the tiles of the destination folder (default None, every tile is generated).
+        ecef (numpy.ndarray): (N, 3) earth centered positions of the points, see tiles_quantize.geodetic_to_ecef
+            (default None, computed here). Tiles quantize views of it.
+        encoding (string or dict): attribute encoding of the tiles, default or compact, or a dict of the settings
+            that differ from default (default default). See encodings.
+        tileset_layout (string): either monolithic or external (default monolithic). See tileset_layouts.
+            The layout only changes the json files, the tiles of the manifest are reused whatever the layout.
+    """
+    def __init__(self, key, lon, lat, alt, value, time, epoch, workers=10, executor="thread", refine="REPLACE", manifest=None, ecef=None, encoding="default",
+                 tileset_layout="monolithic"):
+        if executor not in executors:
+            raise ValueError("executor should be one of {}".format(list(executors)))
+        if refine not in refinements:
+            raise ValueError("refine should be one of {}".format(refinements))
+        if tileset_layout not in tileset_layouts:
+            raise ValueError("tileset_layout should be one of {}".format(tileset_layouts))
+        self.tileset_layout = tileset_layout
+        self.encoding = get_encoding(encoding)
+        # quantization of the values, shared by every tile so that one style decodes them all
+        self.value_encoding = value_encoding(value, self.encoding)
         self.key = key
         self.lon = lon
         self.lat = lat
@@ -20,12 +97,18 @@ class PointCloud:
         self.time = time
         self.value = value
         self.epoch = epoch
+        self.workers = workers
+        self.executor = executor
+        self.refine = refine
+        self.manifest = manifest
+        # converted once for every point, in chunks
+        self.ecef = geodetic_to_ecef(lon, lat, alt) if ecef is None else ecef
         self.tasks = []
-        self.threads = []
-        for i in range(10):
-            self.threads.append(Thread(target=self.worker_function))
-        self.tileset_lock = Lock()
+        self.futures = {}
+        self.fragments = []
+        self.pool = None
         self.tileset_json = deepcopy(tileset_json)
+        self.tileset_json["root"]["refine"] = refine
         self.tileset_json["root"]["boundingVolume"]["region"] = [
                         float(np.min(lon)) * to_rad,
                         float(np.min(lat)) * to_rad,
@@ -35,229 +118,267 @@ class PointCloud:
                         float(np.max(alt)) * to_rad
                       ]
         self.tileset_json["properties"]["epoch"] = "{}Z".format(datetime.utcfromtimestamp(epoch).isoformat())
-
-
-    def worker_function(self):
-        while len(self.tasks) > 0:
-                tile, start, end = self.tasks.pop()
-                # print(tile, start, end)
-                self.generate(tile, start, end)
+        if self.value_encoding is not None:
+            self.tileset_json["extras"] = {"value": self.value_encoding}
 
 
     def start(self):
-        for t in self.threads:
-            t.start()
+        self.pool = executors[self.executor](max_workers=self.workers)
+        for tile, start, end in self.tasks:
+            arguments = self.task_arguments(tile, start, end)
+            task_key = None
+            if self.manifest is not None:
+                task_key = self.task_key(arguments)
+                entry = self.manifest.get("tile/{}".format(tile))
+                if self.manifest.is_current("tile/{}".format(tile), task_key):
+                    # unchanged since the previous run
+                    self.fragments.append((tile, entry["tile"], entry["refined"]))
+                    continue
+            self.futures[self.pool.submit(generate_tile, *arguments)] = task_key
+        self.tasks = []
 
 
     def join(self):
-        for t in self.threads:
-            t.join()
+        try:
+            for future in as_completed(self.futures):
+                fragment = future.result()
+                self.fragments.append(fragment)
+                if self.manifest is not None:
+                    tile, child_tile, refined = fragment
+                    self.manifest.update("tile/{}".format(tile), self.futures[future], tile_files(child_tile), tile=child_tile, refined=refined)
+                    self.manifest.save(force=False)
+        finally:
+            self.pool.shutdown()
+            self.futures = {}
+            if self.manifest is not None:
+                self.manifest.save()
+
+        # merge the tileset.json fragments of the tiles, in tile order
+        for tile, child_tile, refined in sorted(self.fragments, key=lambda fragment: fragment[0]):
+            if self.tileset_layout == "external":
+                child_tile = self.write_external_tileset(tile, child_tile, refined)
+            else:
+                self.tileset_json["properties"]["refined"].extend(refined)
+            self.tileset_json["root"]["children"].append(child_tile)
+
         with open('{}/tileset.json'.format(self.key), mode='w+') as outfile:
             json.dump(self.tileset_json, outfile)
+        self.remove_stale_external_tilesets()
+
+
+    def remove_stale_external_tilesets(self):
+        """Removes the <tile>_tileset.json files, and their sidecars, the tileset.json does not point to,
+        e.g. after switching to the monolithic layout or with fewer tiles than the previous run."""
+        referenced = set()
+        if self.tileset_layout == "external":
+            referenced = {child_tile["content"]["uri"] for child_tile in self.tileset_json["root"]["children"]}
+        for filename in os.listdir(self.key):
+            match = external_tileset_pattern.match(filename)
+            if match is None or match.group(1) in referenced:
+                continue
+            os.remove(os.path.join(self.key, filename))
+            if self.manifest is not None:
+                self.manifest.invalidate("sidecar/{}".format(filename))
+
+
+    def write_external_tileset(self, tile, child_tile, refined):
+        """Writes the <tile>_tileset.json of a tileset.json fragment, returns the tile of the tileset.json pointing to it."""
+        filename = "{}_tileset.json".format(tile)
+        # same asset, epoch and extras as the tileset.json, without its growing list of children
+        external_tileset_json = {**self.tileset_json, "root": child_tile,
+                                 "properties": {**self.tileset_json["properties"], "refined": refined}}
+        with open('{}/{}'.format(self.key, filename), mode='w+') as outfile:
+            json.dump(external_tileset_json, outfile)
+        return {
+            "availability": child_tile["availability"],
+            "geometricError": child_tile["geometricError"],
+            "boundingVolume": child_tile["boundingVolume"],
+            "content": {
+                "uri": filename
+            },
+            "refine": self.refine
+        }
 
 
     def schedule_task(self, tile, start, end):
         self.tasks.append((tile, start, end))
 
 
-    def generate(self, tile, start, end):
-        # print(tile, start, end)
-        parent_tile = self.tileset_json["root"]
-        cartesian, offset, scale, cartographic, region = self.cartographic_to_cartesian(start, end)
-
-        value = self.value[start:end]
-        time = self.time[start:end]
-
-        epoch = int(np.min(time) + self.epoch - 300)
-        epoch = "{}Z".format(datetime.utcfromtimestamp(epoch).isoformat())
-        end = int(np.max(time) + self.epoch + 300)
-        end = "{}Z".format(datetime.utcfromtimestamp(end).isoformat())
-
-        header_length = 28
-        magic = np.string_("pnts")
-        version = 1
-
-        for step in steps:
-            self.tileset_lock.acquire()
-            try:
-                filename = "{}_{}.pnts".format(tile, step)
-                child_tile = {
-                    "availability": "{}/{}".format(epoch, end),
-                    "geometricError": step * 500,
-                    "boundingVolume": {
-                        "region": region
-                    },
-                    "content": {
-                        "uri": filename
-                    },
-                    "refine": "REPLACE"
-                }
-                if step == 1:
-                    self.tileset_json["properties"]["refined"].append(filename)
-                else:
-                    child_tile["children"] = []
-                parent_tile["children"].append(child_tile)
-                parent_tile = child_tile
-            finally:
-                self.tileset_lock.release()
-
-            tile_length = 0
-            feature_table_binary_byte_length = 0
-            batch_table_binary_byte_length = 0
-            length = value[::step].size
-
-            feature_table_json = {
-                "POINTS_LENGTH": length,
-                "BATCH_LENGTH": length,
-                "BATCH_ID": {
-                    "byteOffset": 0,
-                    "componentType": "UNSIGNED_INT"
-                },
-                "POSITION_QUANTIZED": {
-                    "byteOffset": length * 4
-                },
-                "QUANTIZED_VOLUME_OFFSET": offset,
-                "QUANTIZED_VOLUME_SCALE": scale
-            }
-
-            batch_table_json = {
-                "value": {
-                    "byteOffset": 0,
-                    "componentType": "FLOAT",
-                    "type": "SCALAR"
-                },
-                "time": {
-                    "byteOffset": length * 4,
-                    "componentType": "FLOAT",
-                    "type": "SCALAR"
-                },
-                "location": {
-                    "byteOffset": length * 8,
-                    "componentType": "SHORT",
-                    "type": "VEC3"
-                }
-            }
-
-            tile_length += header_length
-
-            feature_table_json_min = json.dumps(feature_table_json, separators=(",", ":")) + "       "
-            feature_table_trim = (tile_length + len(feature_table_json_min)) % 8
-            if feature_table_trim != 0:
-                feature_table_json_min = feature_table_json_min[:-feature_table_trim]
-
-            tile_length += len(feature_table_json_min)
-
-            feature_table_binary_byte_length = length * 4 + length * 3 * 2
-            tile_length += feature_table_binary_byte_length
-            feature_table_padding = tile_length % 8
-            if feature_table_padding != 0:
-                feature_table_padding = 8 - feature_table_padding
-            tile_length += feature_table_padding
-
-            batch_table_json_min = json.dumps(batch_table_json, separators=(",", ":")) + "       "
-            batch_table_trim = (tile_length + len(batch_table_json_min)) % 8
-            if batch_table_trim != 0:
-                batch_table_json_min = batch_table_json_min[:-batch_table_trim]
-
-            tile_length += len(batch_table_json_min)
-
-            batch_table_binary_byte_length = length * 4 * 2 + length * 2 * 3
-            tile_length += batch_table_binary_byte_length
-            batch_table_padding = tile_length % 8
-            if batch_table_padding != 0:
-                batch_table_padding = 8 - batch_table_padding
-            tile_length += batch_table_padding
-
-            with open('{}/{}'.format(self.key, filename), mode='wb+') as outfile:
-                outfile.write(np.string_(magic).tobytes())
-                outfile.write(np.uint32(version).tobytes())
-                outfile.write(np.uint32(tile_length).tobytes())
-                outfile.write(np.uint32(len(feature_table_json_min)).tobytes())
-                outfile.write(np.uint32(feature_table_binary_byte_length + feature_table_padding).tobytes())
-                outfile.write(np.uint32(len(batch_table_json_min)).tobytes())
-                outfile.write(np.uint32(batch_table_binary_byte_length + batch_table_padding).tobytes())
-                outfile.write(np.string_(feature_table_json_min).tobytes())
-                outfile.write(np.arange(length, dtype=np.uint32).tobytes())
-                outfile.write(cartesian[::step, :].tobytes())
-                for _ in range(feature_table_padding):
-                    outfile.write(np.string_(" ").tobytes())
-                outfile.write(np.string_(batch_table_json_min).tobytes())
-                outfile.write(value[::step].astype(np.float32).tobytes())
-                outfile.write(time[::step].astype(np.float32).tobytes())
-                outfile.write(cartographic[::step, :].tobytes())
-                for _ in range(batch_table_padding):
-                    outfile.write(np.string_(" ").tobytes())
-                outfile.seek(0)
-
-
-    def cartographic_to_cartesian(self, start, end):
-        lon = self.lon[start:end]
-        lat = self.lat[start:end]
-        alt = self.alt[start:end]
-        size = lon.size
-
-        cartographic = np.zeros(shape=(size, 3), dtype=np.int16)
-        cartographic[:, 0] = (lon * 32767 / 180).astype(np.int16)
-        cartographic[:, 1] = (lat * 32767 / 180).astype(np.int16)
-        cartographic[:, 2] = (alt / 10).astype(np.int16)
-
-        lon = lon * to_rad
-        lat = lat * to_rad
-
-        radiiSquared = np.array([40680631590769, 40680631590769, 40408299984661.445], dtype=np.float64)
+    def task_arguments(self, tile, start, end):
+        return (self.key, tile, self.lon[start:end], self.lat[start:end], self.alt[start:end],
+                self.value[start:end], self.time[start:end], self.epoch, self.refine, self.ecef[start:end],
+                self.encoding, self.value_encoding)
 
-        N1 = np.multiply(np.cos(lat), np.cos(lon))
-        N2 = np.multiply(np.cos(lat), np.sin(lon))
-        N3 = np.sin(lat)
 
-        magnitude = np.sqrt(np.square(N1) + np.square(N2) + np.square(N3))
+    def task_key(self, arguments):
+        # hash of the points and of the parameters of a tile (the ecef positions derive from the points)
+        return hash_params({
+            "points": hash_arrays(*arguments[2:7]),
+            "parameters": arguments[7:9] + arguments[10:],
+            "ecef": arguments[9].dtype.str,
+            "steps": steps
+        })
 
-        N1 = N1 / magnitude
-        N2 = N2 / magnitude
-        N3 = N3 / magnitude
 
-        K1 = radiiSquared[0] * N1
-        K2 = radiiSquared[1] * N2
-        K3 = radiiSquared[2] * N3
-
-        gamma = np.sqrt(np.multiply(N1, K1) + np.multiply(N2, K2) + np.multiply(N3, K3))
-
-        K1 = K1 / gamma
-        K2 = K2 / gamma
-        K3 = K3 / gamma
-
-        N1 = np.multiply(N1, alt)
-        N2 = np.multiply(N2, alt)
-        N3 = np.multiply(N3, alt)
-
-        # x = np.multiply((N1 + K1), np.random.normal(1, .00005, N1.size))
-        # y = np.multiply((N2 + K2), np.random.normal(1, .00005, N1.size))
-        # z = np.multiply((N3 + K3), np.random.normal(1, .00005, N1.size))
-
-        x = N1 + K1
-        y = N2 + K2
-        z = N3 + K3
-
-        offset = [float(np.min(x)), float(np.min(y)), float(np.min(z))]
-
-        x = x - offset[0]
-        y = y - offset[1]
-        z = z - offset[2]
-
-        scale = [float(abs(np.max(x))), float(abs(np.max(y))), float(abs(np.max(z)))]
-
-        cartesian = np.zeros(shape=(size, 3), dtype=np.uint16)
-        cartesian[:, 0] = (x / scale[0] * 65535.0).astype(np.uint16)
-        cartesian[:, 1] = (y / scale[1] * 65535.0).astype(np.uint16)
-        cartesian[:, 2] = (z / scale[2] * 65535.0).astype(np.uint16)
+    def generate(self, tile, start, end):
+        """Writes the tile files, returns (tile, tileset.json fragment, refined filenames)."""
+        return generate_tile(*self.task_arguments(tile, start, end))
 
-        region = [
-            float(np.min(lon)),
-            float(np.min(lat)),
-            float(np.max(lon)),
-            float(np.max(lat)),
-            float(np.min(alt)),
-            float(np.max(alt))
-        ]
 
-        return cartesian, offset, scale, cartographic, region
+    def cartographic_to_cartesian(self, start, end):
+        return cartographic_to_cartesian(self.lon[start:end], self.lat[start:end], self.alt[start:end], self.ecef[start:end])
+
+
+def generate_tile(key, tile, lon, lat, alt, value, time, root_epoch, refine="REPLACE", ecef=None, encoding=None, value_encoding=None):
+    refined = []
+    parent_tile = None
+    # quantized once per tile, the levels of detail take strided views of it
+    cartesian, offset, scale, cartographic, region = cartographic_to_cartesian(lon, lat, alt, ecef)
+
+    epoch = int(np.min(time) + root_epoch - 300)
+    epoch = "{}Z".format(datetime.utcfromtimestamp(epoch).isoformat())
+    end = int(np.max(time) + root_epoch + 300)
+    end = "{}Z".format(datetime.utcfromtimestamp(end).isoformat())
+
+    for step in steps:
+        filename = "{}_{}.pnts".format(tile, step)
+        level = level_slice(step, refine)
+        child_tile = {
+            "availability": "{}/{}".format(epoch, end),
+            "geometricError": step * 500,
+            "boundingVolume": {
+                "region": region
+            },
+            "content": {
+                "uri": filename
+            },
+            "refine": refine
+        }
+        if step != 1:
+            child_tile["children"] = []
+        if parent_tile is None:
+            tile_root = child_tile
+        else:
+            parent_tile["children"].append(child_tile)
+        parent_tile = child_tile
+
+        if value[level].size == 0:
+            # nothing left to add at this level, e.g. tiny tiles
+            del child_tile["content"]
+            continue
+
+        write_pnts('{}/{}'.format(key, filename), cartesian[level, :], offset, scale,
+                   value[level], time[level], cartographic[level, :], encoding, value_encoding)
+        if step == 1:
+            refined.append(filename)
+
+    return tile, tile_root, refined
+
+
+def tile_files(tile_root):
+    """Returns the content files of a tileset.json fragment."""
+    files = []
+    if "content" in tile_root:
+        files.append(tile_root["content"]["uri"])
+    for child_tile in tile_root.get("children", []):
+        files.extend(tile_files(child_tile))
+    return files
+
+
+def level_slice(step, refine="REPLACE"):
+    """Returns the slice of the points of a tile held by its level of detail step."""
+    if refine == "ADD" and step != steps[0]:
+        # points of this level that are not in the coarser (2 * step) levels
+        return slice(step, None, 2 * step)
+    return slice(None, None, step)
+
+
+def get_encoding(encoding):
+    """Returns the settings of an attribute encoding, given its name or a dict of the settings that differ from default."""
+    if isinstance(encoding, str):
+        if encoding not in encodings:
+            raise ValueError("encoding should be one of {}".format(list(encodings)))
+        return dict(encodings[encoding])
+    settings = {**encodings["default"], **encoding}
+    if settings["value"] != "float32" and settings["value"] not in value_types:
+        raise ValueError("value encoding should be one of {}".format(["float32"] + list(value_types)))
+    if settings["time"] not in ["float32", "uint16"]:
+        raise ValueError("time encoding should be either float32 or uint16")
+    return settings
+
+
+def value_encoding(value, encoding):
+    """Returns the type, offset and scale quantizing the values over their range, None when the values are not quantized."""
+    if encoding["value"] == "float32":
+        return None
+    finite = value[np.isfinite(value)]
+    if finite.size == 0:
+        return {"type": encoding["value"], "offset": 0.0, "scale": 1.0}
+    offset = float(np.min(finite))
+    extent = float(np.max(finite)) - offset
+    levels = np.iinfo(value_types[encoding["value"]][0]).max
+    return {"type": encoding["value"], "offset": offset, "scale": extent / levels if extent > 0 else 1.0}
+
+
+def write_pnts(path, cartesian, offset, scale, value, time, cartographic=None, encoding=None, value_encoding=None):
+    """Writes a .pnts tile of quantized positions, with value, time and optionally cartographic location in its batch table.
+
+    Args:
+        encoding (dict): attribute encoding, see get_encoding (default None, the default encoding).
+        value_encoding (dict): type, offset and scale of the quantized values, see value_encoding (default None, float32 values).
+    """
+    encoding = encodings["default"] if encoding is None else encoding
+    length = value.size
+    extras = {}
+
+    pnts = PntsEncoder()
+    pnts.feature_table["POINTS_LENGTH"] = length
+    if encoding["batch_id"]:
+        pnts.feature_table["BATCH_LENGTH"] = length
+        pnts.add_feature_property("BATCH_ID", np.arange(length, dtype=np.uint32), np.uint32, componentType="UNSIGNED_INT")
+    pnts.add_feature_property("POSITION_QUANTIZED", cartesian, np.uint16)
+    pnts.feature_table["QUANTIZED_VOLUME_OFFSET"] = offset
+    pnts.feature_table["QUANTIZED_VOLUME_SCALE"] = scale
+
+    if value_encoding is None:
+        pnts.add_batch_property("value", value, np.float32, componentType="FLOAT", type="SCALAR")
+    else:
+        dtype, component_type = value_types[value_encoding["type"]]
+        # in float64, so the decoded values stay within half a step of the float32 ones
+        quantized = np.rint((np.asarray(value, np.float64) - value_encoding["offset"]) / value_encoding["scale"])
+        np.clip(quantized, 0, np.iinfo(dtype).max, out=quantized)
+        pnts.add_batch_property("value", quantized, dtype, componentType=component_type, type="SCALAR")
+        extras["value"] = value_encoding
+
+    if encoding["time"] == "float32":
+        pnts.add_batch_property("time", time, np.float32, componentType="FLOAT", type="SCALAR")
+    else:
+        base = int(np.min(time)) if length else 0
+        relative_time = time.astype(np.int64) - base
+        if length and np.max(relative_time) > np.iinfo(np.uint16).max:
+            pnts.add_batch_property("time", relative_time, np.uint32, componentType="UNSIGNED_INT", type="SCALAR")
+        else:
+            pnts.add_batch_property("time", relative_time, np.uint16, componentType="UNSIGNED_SHORT", type="SCALAR")
+        extras["time"] = {"offset": base}
+
+    if encoding["location"] and cartographic is not None:
+        pnts.add_batch_property("location", cartographic, np.int16, componentType="SHORT", type="VEC3")
+    if extras:
+        pnts.batch_table["extras"] = extras
+
+    return pnts.write(path)
+
+
+def cartographic_to_cartesian(lon, lat, alt, ecef=None):
+    """Returns the quantized positions (with their offset and scale), the int16 cartographic locations and the region of points.
+
+    Args:
+        lon, lat, alt (numpy.ndarray): point locations.
+        ecef (numpy.ndarray): (n, 3) earth centered positions of the points (default None, computed here).
+    """
+    if ecef is None:
+        ecef = geodetic_to_ecef(lon, lat, alt)
+    cartesian, offset, scale = quantize_positions(ecef)
+    cartographic = quantize_cartographic(lon, lat, alt)
+    region = tile_region(lon, lat, alt)
+    return cartesian, offset, scale, cartographic, region
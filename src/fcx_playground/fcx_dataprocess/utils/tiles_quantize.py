@@ -0,0 +1,100 @@
+import numpy as np
+
+to_rad = np.pi / 180.0
+
+# squared radii of the WGS84 ellipsoid, as used by Cesium
+radii_squared = np.array([40680631590769, 40680631590769, 40408299984661.445], dtype=np.float64)
+
+# points per pass of the chunked kernels, the temporaries are bounded by it
+chunk_size = 262144
+
+
+def geodetic_to_ecef(lon, lat, alt, dtype=np.float64, out=None, chunk=chunk_size):
+    """Returns the (n, 3) earth centered, earth fixed positions, in meters, of degrees longitudes/latitudes and meters altitudes.
+
+    Computed chunk by chunk, in place in the output, so the temporaries hold at most chunk points,
+    whatever the number of points.
+
+    Args:
+        lon, lat, alt (numpy.ndarray): point locations.
+        dtype: precision of the computation and of the output (default float64).
+        out (numpy.ndarray): preallocated (n, 3) output of dtype (default: allocated).
+        chunk (int): number of points per pass.
+    """
+    size = lon.shape[0]
+    if out is None:
+        out = np.empty((size, 3), dtype=dtype)
+    dtype = out.dtype
+    radii = radii_squared.astype(dtype)
+    for start in range(0, size, chunk):
+        stop = min(start + chunk, size)
+        lon_rad = np.multiply(lon[start:stop], to_rad, dtype=dtype)
+        lat_rad = np.multiply(lat[start:stop], to_rad, dtype=dtype)
+
+        # surface normal of the ellipsoid
+        normal = out[start:stop]
+        cos_lat = np.cos(lat_rad)
+        np.multiply(cos_lat, np.cos(lon_rad), out=normal[:, 0])
+        np.multiply(cos_lat, np.sin(lon_rad), out=normal[:, 1])
+        np.sin(lat_rad, out=normal[:, 2])
+        magnitude = np.square(normal[:, 0])
+        magnitude += np.square(normal[:, 1])
+        magnitude += np.square(normal[:, 2])
+        np.sqrt(magnitude, out=magnitude)
+        normal /= magnitude[:, np.newaxis]
+
+        # position on the ellipsoid surface, then raised along the normal by the altitude
+        surface = normal * radii
+        gamma = normal[:, 0] * surface[:, 0]
+        gamma += normal[:, 1] * surface[:, 1]
+        gamma += normal[:, 2] * surface[:, 2]
+        np.sqrt(gamma, out=gamma)
+        surface /= gamma[:, np.newaxis]
+        normal *= alt[start:stop, np.newaxis]
+        normal += surface
+    return out
+
+
+def quantize_positions(positions, out=None, chunk=chunk_size):
+    """Returns the 16 bits quantized positions of a tile, with their QUANTIZED_VOLUME_OFFSET and QUANTIZED_VOLUME_SCALE.
+
+    Args:
+        positions (numpy.ndarray): (n, 3) cartesian positions, e.g. a view of the output of geodetic_to_ecef.
+        out (numpy.ndarray): preallocated (n, 3) uint16 output (default: allocated).
+        chunk (int): number of points per pass.
+    """
+    size = positions.shape[0]
+    if out is None:
+        out = np.empty((size, 3), dtype=np.uint16)
+    offset = np.min(positions, axis=0)
+    extent = np.max(positions, axis=0) - offset
+    # flat along an axis, e.g. a single point
+    scale = np.where(extent > 0, extent, 1).astype(positions.dtype)
+    for start in range(0, size, chunk):
+        stop = min(start + chunk, size)
+        quantized = positions[start:stop] - offset
+        quantized /= scale
+        quantized *= 65535.0
+        np.copyto(out[start:stop], quantized, casting="unsafe")
+    return out, [float(axis_offset) for axis_offset in offset], [float(axis_scale) for axis_scale in scale]
+
+
+def quantize_cartographic(lon, lat, alt):
+    """Returns the (n, 3) int16 cartographic locations: longitude and latitude in 1/32767 of half turns, altitude in decameters."""
+    cartographic = np.empty(shape=(lon.shape[0], 3), dtype=np.int16)
+    np.copyto(cartographic[:, 0], lon * 32767 / 180, casting="unsafe")
+    np.copyto(cartographic[:, 1], lat * 32767 / 180, casting="unsafe")
+    np.copyto(cartographic[:, 2], alt / 10, casting="unsafe")
+    return cartographic
+
+
+def tile_region(lon, lat, alt):
+    """Returns the 3D Tiles bounding region of points: west, south, east, north in radians, minimum and maximum altitudes."""
+    return [
+        float(np.multiply(np.min(lon), to_rad, dtype=lon.dtype)),
+        float(np.multiply(np.min(lat), to_rad, dtype=lat.dtype)),
+        float(np.multiply(np.max(lon), to_rad, dtype=lon.dtype)),
+        float(np.multiply(np.max(lat), to_rad, dtype=lat.dtype)),
+        float(np.min(alt)),
+        float(np.max(alt))
+    ]
@@ -2,21 +2,79 @@ import os
 import zarr
 import numpy as np
 from .tiles_point_cloud import PointCloud
+from .tiles_octree import OctreePointCloud
+from .zarr_index import TimeIndex, query_region
+from .zarr_storage import read_location
+from .tiles_quantize import geodetic_to_ecef
+from .manifest import Manifest
+from .tiles_compress import compress_tiles, compression_settings, check_compression, record_compression, remove_stale_sidecars
 
 to_rad = np.pi / 180.0
 to_deg = 180.0 / np.pi
 
-def write_tiles(variable, epoch, end, zarr_location, point_cloud_folder):
+hierarchies = ["time", "octree"]
+
+
+def tiles_manifest_path(point_cloud_folder):
+    """Returns the path of the manifest of the tiles of a point cloud folder, outside of the folder."""
+    point_cloud_folder = os.path.normpath(point_cloud_folder)
+    manifest_path = point_cloud_folder + ".manifest.json"
+    legacy_path = os.path.join(point_cloud_folder, "manifest.json")
+    if os.path.exists(legacy_path):
+        # manifest of a previous version, inside the served folder, moved out
+        os.replace(legacy_path, manifest_path)
+    return manifest_path
+
+
+def write_tiles(variable, epoch, end, zarr_location, point_cloud_folder, workers=10, executor="thread", hierarchy="time", max_points=100000, refine=None, bbox=None, incremental=None, encoding="default", compress=None, compress_level=None, keep_raw=True,
+                tileset_layout="monolithic"):
     """Generates json pointcloud from a given zarr file input
 
     Args:
         variable (_type_): _description_
-        epoch (_type_): _description_
-        end (_type_): _description_
+        epoch (int): start of the time window, unix time in seconds.
+        end (int): end of the time window, unix time in seconds.
         zarr_location (string): source zarr file.
         point_cloud_folder (string): destination folder for 3d tile json file.
+        workers (int): number of workers generating the tiles.
+        executor (string): either thread or process, the kind of workers generating the tiles.
+        hierarchy (string): either time or octree.
+            time: tiles of 530000 consecutive points, each one a chain of strided levels of detail.
+            octree: tiles partitioned in space, of at most max_points points each.
+        max_points (int): maximum number of points per tile of the octree hierarchy.
+        refine (string): either REPLACE or ADD, the refinement of the levels of detail of the time hierarchy (default REPLACE).
+            ADD levels do not duplicate the points of the coarser levels.
+        bbox (list): [min_lon, min_lat, min_alt, max_lon, max_lat, max_alt], only the points inside it are tiled (default: all).
+            Raises ValueError when no point is inside it, or inside the time window.
+        incremental (bool): skip the tiles of the time hierarchy that did not change since the previous run in point_cloud_folder,
+            recorded in <point_cloud_folder>.manifest.json, next to the folder so it is not served with the tiles (default True).
+        refine, incremental and the external tileset_layout only apply to the time hierarchy, the octree hierarchy rejects them.
+        encoding (string or dict): attribute encoding of the tiles, either default or compact (quantized value, relative time,
+            no BATCH_ID nor location), or a dict of settings, see tiles_point_cloud.encodings.
+            The location is opt-in with the compact encoding: {**encodings["compact"], "location": True}.
+        compress (string or list): content encodings of pre-compressed sidecars of the tiles and tileset.json,
+            gzip and/or br, e.g. 0_1.pnts.gz (default None, no sidecars). See tiles_compress.compress_tiles.
+        compress_level (int): compression level of the sidecars (default None, gzip 6 and br 6).
+        keep_raw (bool): keep the uncompressed files next to their sidecars (default True).
+            Incremental runs record the sidecars in the manifest, and reuse them while the tiles and the settings are unchanged.
+            The sidecars of a previous run that this run does not produce (other encodings, no compression) are removed.
+        tileset_layout (string): either monolithic or external, the layout of the json files of the time hierarchy.
+            external writes the levels of detail of every tile in its own <tile>_tileset.json, loaded by Cesium
+            when the tile is visible, and keeps the tileset.json small for long flights.
     """
 
+    if hierarchy not in hierarchies:
+        raise ValueError("hierarchy should be one of {}".format(hierarchies))
+    if hierarchy == "octree":
+        # the octree nodes always ADD the points of their children, and are all written on every run
+        unsupported = [name for name, option in [("refine", refine), ("incremental", incremental)] if option is not None]
+        if tileset_layout != "monolithic":
+            unsupported.append("tileset_layout {}".format(tileset_layout))
+        if unsupported:
+            raise ValueError("{} not supported by the octree hierarchy".format(", ".join(unsupported)))
+    refine = "REPLACE" if refine is None else refine
+    incremental = True if incremental is None else incremental
+
     #out_key = f"{os.getenv('CRS_OUTPUT_FLIGHT_PATH')}/{shortname}"
     #pc_out_key = f"{output_path}/point_cloud"
 
@@ -27,47 +85,60 @@ def write_tiles(variable, epoch, end, zarr_location, point_cloud_folder):
         pass
     '''
 
-    try:
-        os.mkdir(point_cloud_folder)
-    except:
-        pass
-
     # LOAD THE DATA.
     store = zarr.DirectoryStore(zarr_location)
     root = zarr.group(store=store)
 
-    chunk_id = root["chunk_id"][:]
-    num_chunks = chunk_id.shape[0]
-    id = np.argmax(chunk_id[:, 1] > epoch) - 1
-    start_id = chunk_id[0 if id < 0 else id, 0]
-    id = num_chunks - np.argmax(chunk_id[::-1, 1] < end)
-    end_id = chunk_id[id, 0] if id < num_chunks else root["time"].size - 1
-
     root_epoch = root.attrs["epoch"]
-    location = root["location"][start_id:end_id]
-    lon = location[:, 0]
-    lat = location[:, 1]
-    alt = location[:, 2]
-    value = root["value"][variable][start_id:end_id]
-    time = root["time"][start_id:end_id]
-
-    # filter data using mask
-    epoch = epoch - root_epoch # date-time
-    end = end - root_epoch
-    mask = np.logical_and(time >= epoch, time <= end)
-    lon = lon[mask]
-    lat = lat[mask]
-    alt = alt[mask]
-    value = value[mask]
-    time = time[mask]
+    if bbox is not None:
+        # points of the region of interest, inside the time window
+        lon, lat, alt, value, time = query_region(root, variable, bbox, epoch, end)
+    else:
+        # locate the points of the time window
+        start_id, end_id = TimeIndex(root).query(epoch, end)
+
+        lon, lat, alt = read_location(root, start_id, end_id)
+        value = root["value"][variable][start_id:end_id]
+        time = root["time"][start_id:end_id]
+
+    if time.size == 0:
+        # nothing to tile, e.g. a region or a time window away from the flight
+        if bbox is not None:
+            raise ValueError("no points in the region {} and the time window {}-{}".format(bbox, epoch, end))
+        raise ValueError("no points in the time window {}-{}".format(epoch, end))
+
+    try:
+        os.mkdir(point_cloud_folder)
+    except:
+        pass
+
+    # earth centered positions of every point, converted once (chunk by chunk), the tiles quantize views of it
+    ecef = geodetic_to_ecef(lon, lat, alt)
 
     # Generate Pointcloud Tileset
-    point_cloud = PointCloud(point_cloud_folder, lon, lat, alt, value, time, root_epoch)
+    if hierarchy == "octree":
+        point_cloud = OctreePointCloud(point_cloud_folder, lon, lat, alt, value, time, root_epoch, max_points=max_points, workers=workers, executor=executor, ecef=ecef, encoding=encoding)
+    else:
+        manifest = Manifest(tiles_manifest_path(point_cloud_folder), base_dir=point_cloud_folder) if incremental else None
+        if manifest is not None:
+            check_compression(manifest, compression_settings(compress, compress_level, keep_raw))
+        point_cloud = PointCloud(point_cloud_folder, lon, lat, alt, value, time, root_epoch, workers=workers, executor=executor, refine=refine, manifest=manifest, ecef=ecef, encoding=encoding,
+                                 tileset_layout=tileset_layout)
 
-    for tile in range(int(np.ceil(time.size / 530000))):
-        start_id = tile * 530000
-        end_id = np.min([start_id + 530000, time.size])
-        point_cloud.schedule_task(tile, start_id, end_id)
+        for tile in range(int(np.ceil(time.size / 530000))):
+            start_id = tile * 530000
+            end_id = np.min([start_id + 530000, time.size])
+            point_cloud.schedule_task(tile, start_id, end_id)
 
     point_cloud.start()
-    point_cloud.join()
\ No newline at end of file
+    point_cloud.join()
+
+    manifest = point_cloud.manifest if hierarchy == "time" else None
+    settings = compression_settings(compress, compress_level, keep_raw)
+    # sidecars of a previous run with other settings would be served instead of the new tiles
+    remove_stale_sidecars(point_cloud_folder, settings["encodings"], manifest=manifest)
+    if compress is not None:
+        compress_tiles(point_cloud_folder, compress, level=compress_level, workers=workers, keep_raw=keep_raw, manifest=manifest)
+    if manifest is not None:
+        record_compression(manifest, settings)
+        manifest.save()
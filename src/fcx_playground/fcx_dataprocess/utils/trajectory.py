@@ -0,0 +1,61 @@
+import numpy as np
+from .tiles_quantize import geodetic_to_ecef
+
+
+def simplify_trajectory(time, longitude, latitude, altitude, angles=(), position_tolerance=10.0, angle_tolerance=np.pi / 180, window=4096):
+    """Returns the boolean mask of the samples kept by an error bounded Douglas-Peucker simplification of a track.
+
+    The error of a dropped sample is measured against what Cesium shows at its time, i.e. the linear interpolation
+    in time between the kept samples around it: the distance to the interpolated position (synchronized euclidean
+    distance, in 3d), and the difference to the interpolated angles. Every dropped sample is within both tolerances.
+
+    The track is simplified in windows of window samples (their boundaries are kept), so the worst case is
+    linear in the length of the track.
+
+    Args:
+        time (numpy.ndarray): strictly increasing sample times, in any numeric unit.
+        longitude, latitude (numpy.ndarray): degrees.
+        altitude (numpy.ndarray): meters.
+        angles (list): arrays of angles (e.g. roll, pitch, heading) interpolated by the client, in radians.
+        position_tolerance (float): maximum position error, in meters.
+        angle_tolerance (float): maximum angle error, in radians.
+        window (int): number of samples simplified at a time.
+    """
+    if not position_tolerance > 0:
+        raise ValueError("position_tolerance should be positive")
+    if not angle_tolerance > 0:
+        raise ValueError("angle_tolerance should be positive")
+    time = np.asarray(time, dtype=np.float64)
+    size = time.size
+    keep = np.zeros(size, dtype=bool)
+    if size == 0:
+        return keep
+    keep[::window] = True
+    keep[-1] = True
+
+    # same earth centered positions as the tiles
+    position = geodetic_to_ecef(np.asarray(longitude, dtype=np.float64), np.asarray(latitude, dtype=np.float64), np.asarray(altitude, dtype=np.float64))
+    angles = [np.asarray(angle, dtype=np.float64) for angle in angles]
+    position_tolerance_squared = position_tolerance * position_tolerance
+
+    stack = [(start, min(start + window, size - 1)) for start in range(0, size - 1, window)]
+    while stack:
+        first, last = stack.pop()
+        if last - first < 2:
+            continue
+        fraction = ((time[first + 1:last] - time[first]) / (time[last] - time[first]))[:, np.newaxis]
+
+        # squared synchronized euclidean distance, relative to the tolerance
+        interpolated = position[first] + fraction * (position[last] - position[first])
+        error = np.sum(np.square(position[first + 1:last] - interpolated), axis=1) / position_tolerance_squared
+        for angle in angles:
+            interpolated = angle[first] + fraction[:, 0] * (angle[last] - angle[first])
+            np.maximum(error, np.square((angle[first + 1:last] - interpolated) / angle_tolerance), out=error)
+
+        worst = int(np.argmax(error))
+        if error[worst] > 1:
+            middle = first + 1 + worst
+            keep[middle] = True
+            stack.append((first, middle))
+            stack.append((middle, last))
+    return keep
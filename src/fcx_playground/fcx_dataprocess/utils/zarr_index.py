@@ -0,0 +1,200 @@
+import numpy as np
+from .zarr_storage import location_chunk, location_size, read_location
+
+# distance, in points, between two samples of the fine grained time index
+index_stride = 4096
+
+def build_time_index(root, stride=index_stride):
+    """Writes the time index of a zarr store, in the index/time group.
+
+    The time index has two granularities:
+        chunk_min, chunk_max: the time range of every chunk of the time array.
+        samples: the time of every stride-th point.
+
+    Args:
+        root (zarr.hierarchy.Group): zarr store with a sorted time array.
+        stride (int): distance, in points, between two samples.
+    """
+    chunk_min, chunk_max, samples = time_index_arrays(root["time"], stride)
+    z_index = root.require_group("index")
+    if "time" in z_index:
+        del z_index["time"]
+    z_time_index = z_index.create_group("time")
+    z_time_index.array("chunk_min", chunk_min, chunks=None)
+    z_time_index.array("chunk_max", chunk_max, chunks=None)
+    z_time_index.array("samples", samples, chunks=None)
+    z_time_index.attrs.put({
+        "stride": stride,
+        "chunk": root["time"].chunks[0]
+    })
+
+
+def time_index_arrays(z_time, stride=index_stride):
+    """Returns the per chunk min, per chunk max and every stride-th time of the time array, read one chunk at a time."""
+    size = z_time.size
+    chunk = z_time.chunks[0]
+    num_chunks = int(np.ceil(size / chunk))
+    chunk_min = np.zeros(num_chunks, dtype=z_time.dtype)
+    chunk_max = np.zeros(num_chunks, dtype=z_time.dtype)
+    samples = np.zeros(int(np.ceil(size / stride)), dtype=z_time.dtype)
+    for i in range(num_chunks):
+        start = i * chunk
+        time = z_time[start:start + chunk]
+        chunk_min[i] = np.min(time)
+        chunk_max[i] = np.max(time)
+        first_sample = int(np.ceil(start / stride))
+        chunk_samples = time[first_sample * stride - start::stride]
+        samples[first_sample:first_sample + chunk_samples.size] = chunk_samples
+    return chunk_min, chunk_max, samples
+
+
+def build_location_index(root):
+    """Writes the location index of a zarr store, in the index/location group.
+
+    chunk_min, chunk_max: the lon/lat/alt bounding box of every chunk of the location arrays.
+
+    Args:
+        root (zarr.hierarchy.Group): zarr store with lon/lat/alt locations, interleaved or columnar (see zarr_storage).
+    """
+    chunk_min, chunk_max = location_index_arrays(root)
+    z_index = root.require_group("index")
+    if "location" in z_index:
+        del z_index["location"]
+    z_location_index = z_index.create_group("location")
+    z_location_index.array("chunk_min", chunk_min, chunks=None)
+    z_location_index.array("chunk_max", chunk_max, chunks=None)
+    z_location_index.attrs.put({
+        "chunk": location_chunk(root)
+    })
+
+
+def location_index_arrays(root):
+    """Returns the per chunk lon/lat/alt min and max of the location of a zarr store, read one chunk at a time."""
+    chunk = location_chunk(root)
+    num_chunks = int(np.ceil(location_size(root) / chunk))
+    chunk_min = np.zeros((num_chunks, 3), dtype=np.float32)
+    chunk_max = np.zeros((num_chunks, 3), dtype=np.float32)
+    for i in range(num_chunks):
+        for axis, column in enumerate(read_location(root, i * chunk, (i + 1) * chunk)):
+            chunk_min[i, axis] = np.min(column)
+            chunk_max[i, axis] = np.max(column)
+    return chunk_min, chunk_max
+
+
+def query_region(root, variable, bbox, epoch=None, end=None):
+    """Returns the lon, lat, alt, value and time of the points inside a lon/lat/alt box, optionally inside a time window.
+
+    Only the chunks whose bounding box intersects the box (and, with a time window, the chunks of the window) are read.
+
+    Args:
+        root (zarr.hierarchy.Group): zarr store.
+        variable (string): name of the value array, e.g. ref.
+        bbox (list): [min_lon, min_lat, min_alt, max_lon, max_lat, max_alt], in degrees and meters.
+        epoch (int): start of the time window, unix time in seconds (default: no time window).
+        end (int): end of the time window, unix time in seconds (default: no time window).
+    """
+    size = location_size(root)
+    chunk = location_chunk(root)
+    if "index" in root and "location" in root["index"]:
+        chunk_min = root["index"]["location"]["chunk_min"][:]
+        chunk_max = root["index"]["location"]["chunk_max"][:]
+    else:
+        chunk_min, chunk_max = location_index_arrays(root)
+
+    lower = np.array(bbox[:3], dtype=np.float64)
+    upper = np.array(bbox[3:], dtype=np.float64)
+
+    start, stop = 0, size
+    if epoch is not None or end is not None:
+        time_index = TimeIndex(root)
+        start, stop = time_index.query(time_index.epoch if epoch is None else epoch, np.iinfo(np.int64).max if end is None else end)
+
+    candidates = np.logical_and(np.all(chunk_max >= lower, axis=1), np.all(chunk_min <= upper, axis=1))
+    candidates[:start // chunk] = False
+    candidates[-(-stop // chunk):] = False
+
+    lon, lat, alt, value, time = [], [], [], [], []
+    for i in np.nonzero(candidates)[0]:
+        chunk_start = max(i * chunk, start)
+        chunk_stop = min((i + 1) * chunk, stop)
+        location = read_location(root, chunk_start, chunk_stop)
+        mask = np.ones(chunk_stop - chunk_start, dtype=bool)
+        for axis, column in enumerate(location):
+            mask &= np.logical_and(column >= lower[axis], column <= upper[axis])
+        if not np.any(mask):
+            continue
+        lon.append(location[0][mask])
+        lat.append(location[1][mask])
+        alt.append(location[2][mask])
+        value.append(root["value"][variable][chunk_start:chunk_stop][mask])
+        time.append(root["time"][chunk_start:chunk_stop][mask])
+
+    if not time:
+        empty = np.zeros(0, dtype=np.float32)
+        return empty, empty, empty, np.zeros(0, dtype=root["value"][variable].dtype), np.zeros(0, dtype=root["time"].dtype)
+    return tuple(np.concatenate(column) for column in [lon, lat, alt, value, time])
+
+
+class TimeIndex:
+    """
+    Time range lookups over the sorted time array of a zarr store.
+
+    A query first locates the chunks of the time window with the per chunk min/max,
+    then narrows it down to stride points with the samples, and only reads those points to get the exact offsets.
+    Stores written without an index are indexed in memory, reading their time array once.
+
+    Example:
+        index = TimeIndex(root)
+        start, stop = index.query(epoch, end)
+        value = root["value"]["ref"][start:stop]
+    """
+    def __init__(self, root):
+        self.root = root
+        self.z_time = root["time"]
+        self.epoch = root.attrs["epoch"]
+        self.size = self.z_time.size
+        self.chunk = self.z_time.chunks[0]
+        if "index" in root and "time" in root["index"]:
+            z_time_index = root["index"]["time"]
+            self.stride = z_time_index.attrs["stride"]
+            self.chunk_min = z_time_index["chunk_min"][:]
+            self.chunk_max = z_time_index["chunk_max"][:]
+            self.samples = z_time_index["samples"][:]
+        else:
+            self.stride = index_stride
+            self.chunk_min, self.chunk_max, self.samples = time_index_arrays(self.z_time, self.stride)
+
+    def query(self, epoch, end):
+        """Returns the (start, stop) offsets of the points with epoch <= time <= end.
+
+        Args:
+            epoch (int): start of the time window, unix time in seconds.
+            end (int): end of the time window, unix time in seconds.
+        """
+        start = self.search(epoch - self.epoch, "left")
+        stop = self.search(end - self.epoch, "right")
+        return start, max(start, stop)
+
+    def chunk_range(self, epoch, end):
+        """Returns the (first, last + 1) chunks holding points with epoch <= time <= end."""
+        first = int(np.searchsorted(self.chunk_max, epoch - self.epoch, "left"))
+        last = int(np.searchsorted(self.chunk_min, end - self.epoch, "right"))
+        return first, max(first, last)
+
+    def search(self, time, side="left"):
+        """Same as numpy.searchsorted over the time array (relative to the store epoch), reading at most stride points."""
+        time = np.int64(time)
+        # chunk granularity
+        chunk = int(np.searchsorted(self.chunk_max, time, side))
+        if chunk == self.chunk_max.size:
+            return self.size
+        if time < self.chunk_min[chunk] or (side == "left" and time == self.chunk_min[chunk]):
+            return chunk * self.chunk
+        # sample granularity, inside the chunk
+        first_sample = -(-chunk * self.chunk // self.stride)
+        last_sample = -(-min((chunk + 1) * self.chunk, self.size) // self.stride)
+        sample = first_sample + int(np.searchsorted(self.samples[first_sample:last_sample], time, side))
+        start = max((sample - 1) * self.stride, chunk * self.chunk)
+        stop = min(sample * self.stride, (chunk + 1) * self.chunk, self.size)
+        # point granularity
+        return start + int(np.searchsorted(self.z_time[start:stop], time, side))
@@ -0,0 +1,105 @@
+import zarr
+import numpy as np
+from numcodecs import Blosc, Delta
+
+# storage layouts of the intermediate zarr store, picked per deployment (see benchmarks/zarr_storage_benchmark.py)
+#   chunk: points per chunk.
+#   cname, clevel, shuffle: blosc compressor of every array.
+#   columnar: lon, lat and alt in separate location/lon, location/lat, location/alt arrays,
+#       instead of one interleaved (N, 3) location array. Separate columns compress better.
+#   delta_time: store the differences between consecutive times (small, as time is sorted), decoded on read.
+storage_presets = {
+    "default": {"chunk": 262144, "cname": "zstd", "clevel": 3, "shuffle": Blosc.SHUFFLE, "columnar": False, "delta_time": False},
+    "fast-write": {"chunk": 524288, "cname": "lz4", "clevel": 1, "shuffle": Blosc.SHUFFLE, "columnar": False, "delta_time": False},
+    "small-on-disk": {"chunk": 1048576, "cname": "zstd", "clevel": 7, "shuffle": Blosc.BITSHUFFLE, "columnar": True, "delta_time": True},
+    "fast-random-read": {"chunk": 65536, "cname": "lz4", "clevel": 5, "shuffle": Blosc.SHUFFLE, "columnar": True, "delta_time": False},
+}
+
+location_columns = ["lon", "lat", "alt"]
+
+
+def get_storage_preset(name):
+    """Returns the settings of a storage preset, by name."""
+    if name not in storage_presets:
+        raise ValueError("storage should be one of {}".format(", ".join(storage_presets)))
+    return dict(storage_presets[name])
+
+
+def storage_compressor(preset):
+    return Blosc(cname=preset["cname"], clevel=preset["clevel"], shuffle=preset["shuffle"])
+
+
+def create_store_arrays(root, size, preset, variables, dtype=np.float32):
+    """Creates the location, time and value arrays of a zarr store, at their final size, in the layout of a storage preset.
+
+    Args:
+        root (zarr.hierarchy.Group): empty zarr store.
+        size (int): number of points.
+        preset (dict): storage preset, see get_storage_preset.
+        variables (list): names of the value arrays, e.g. ["ref"].
+        dtype: dtype of the location and value arrays.
+    """
+    chunk = preset["chunk"]
+    compressor = storage_compressor(preset)
+    if preset["columnar"]:
+        z_location = root.create_group("location")
+        for name in location_columns:
+            z_location.create_dataset(name, shape=(size), chunks=(chunk), dtype=dtype, compressor=compressor)
+    else:
+        root.create_dataset("location", shape=(size, 3), chunks=(chunk, None), dtype=dtype, compressor=compressor)
+    filters = [Delta(dtype=np.int32)] if preset["delta_time"] else None
+    root.create_dataset("time", shape=(size), chunks=(chunk), dtype=np.int32, compressor=compressor, filters=filters)
+    z_vars = root.create_group("value")
+    for variable in variables:
+        z_vars.create_dataset(variable, shape=(size), chunks=(chunk), dtype=dtype, compressor=compressor)
+
+
+def is_columnar(root):
+    return isinstance(root["location"], zarr.hierarchy.Group)
+
+
+def location_arrays(root):
+    """Returns the zarr arrays of lon, lat and alt, either columns or the interleaved (N, 3) array (three times)."""
+    if is_columnar(root):
+        return [root["location"][name] for name in location_columns]
+    return [root["location"]] * 3
+
+
+def location_size(root):
+    return location_arrays(root)[0].shape[0]
+
+
+def location_chunk(root):
+    """Returns the number of points per chunk of the location arrays."""
+    return location_arrays(root)[0].chunks[0]
+
+
+def read_location(root, start=None, stop=None):
+    """Returns the lon, lat and alt of the points start:stop, whatever the layout of the location."""
+    if is_columnar(root):
+        return tuple(z_column[start:stop] for z_column in location_arrays(root))
+    location = root["location"][start:stop]
+    return location[:, 0], location[:, 1], location[:, 2]
+
+
+def write_location(root, start, lon, lat, alt):
+    """Writes the lon, lat and alt of the points from start, whatever the layout of the location."""
+    stop = start + lon.shape[0]
+    if is_columnar(root):
+        for z_column, column in zip(location_arrays(root), [lon, lat, alt]):
+            z_column[start:stop] = column
+        return
+    z_location = root["location"]
+    location = np.empty((lon.shape[0], 3), dtype=z_location.dtype)
+    location[:, 0] = lon
+    location[:, 1] = lat
+    location[:, 2] = alt
+    z_location[start:stop] = location
+
+
+def resize_location(root, size):
+    if is_columnar(root):
+        for z_column in location_arrays(root):
+            z_column.resize(size)
+    else:
+        root["location"].resize(size, 3)
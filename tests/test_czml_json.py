@@ -0,0 +1,73 @@
+import json
+
+import numpy as np
+import pytest
+
+from fcx_playground.fcx_dataprocess.utils.czml_json import fixed_point_chars, format_rows
+
+
+def reference(value, precision):
+    """Text of a value rounded like fixed_point_chars (half to even on the scaled value), without negative zeros."""
+    rounded = np.rint(value * 10 ** precision) / 10 ** precision
+    if rounded == 0:
+        rounded = 0.0
+    if precision == 0:
+        return json.dumps(int(rounded))
+    return "{:.{}f}".format(rounded, precision)
+
+
+@pytest.mark.parametrize("precision", [0, 1, 3, 7])
+def test_matches_reference(precision):
+    rng = np.random.default_rng(precision)
+    values = np.concatenate([
+        rng.normal(0, 1, 1000),
+        rng.normal(0, 1e6, 1000),
+        np.round(rng.normal(0, 100, 1000), precision),
+        [0.0, -0.0, 1.0, -1.0, 10.0, -10.0, 1e11, -1e11]
+    ])
+    text = format_rows([values], [precision])
+    assert text.split(",") == [reference(value, precision) for value in values]
+    # valid json, within half a unit of the last digit
+    error = np.abs(np.array(json.loads("[{}]".format(text))) - values)
+    assert np.all(error <= 0.5 * 10 ** -precision + 1e-12 * np.abs(values))
+
+
+@pytest.mark.parametrize("value, precision, text", [
+    # negative zero
+    (-0.0, 2, "0.00"),
+    (-0.001, 2, "0.00"),
+    (-0.4, 0, "0"),
+    # rounding carries into a new digit
+    (9.996, 2, "10.00"),
+    (-9.996, 2, "-10.00"),
+    (99.9996, 3, "100.000"),
+    (999999.5, 0, "1000000"),
+    # leading zeros of the fraction, and of values under one
+    (0.05, 2, "0.05"),
+    (-0.5, 1, "-0.5"),
+    (1.005, 1, "1.0"),
+    (123456789.123, 3, "123456789.123"),
+])
+def test_boundary_cases(value, precision, text):
+    assert format_rows([np.array([value])], [precision]) == text
+
+
+def test_rows_interleave_columns():
+    time = np.array([0, 30, 60])
+    longitude = np.array([-124.5, -124.25, -124.125])
+    altitude = np.array([1000.04, 1000.06, -0.04])
+    text = format_rows([time, longitude, altitude], [0, 3, 1])
+    assert text == "0,-124.500,1000.0,30,-124.250,1000.1,60,-124.125,0.0"
+    assert json.loads("[{}]".format(text)) == [0, -124.5, 1000.0, 30, -124.25, 1000.1, 60, -124.125, 0.0]
+
+
+def test_empty_and_non_finite():
+    assert format_rows([np.zeros(0), np.zeros(0)], [0, 2]) == ""
+    chars, mask = fixed_point_chars(np.zeros(0), 2)
+    assert chars.shape[0] == 0 and mask.shape[0] == 0
+    # out of the int64 range once scaled
+    with pytest.raises(ValueError):
+        format_rows([np.array([1e12])], [7])
+    for value in [np.nan, np.inf, -np.inf]:
+        with pytest.raises(ValueError):
+            format_rows([np.array([1.0, value])], [2])
@@ -0,0 +1,109 @@
+import os
+
+import pytest
+
+moto = pytest.importorskip("moto")
+import boto3
+
+from fcx_playground.fcx_dataprocess.utils.s3_cache import S3Cache
+
+bucket = "fcx-test"
+
+
+@pytest.fixture
+def client(monkeypatch):
+    # a local s3 stand-in, no credentials nor network needed
+    monkeypatch.setenv("AWS_ACCESS_KEY_ID", "testing")
+    monkeypatch.setenv("AWS_SECRET_ACCESS_KEY", "testing")
+    monkeypatch.setenv("AWS_DEFAULT_REGION", "us-east-1")
+    with moto.mock_aws():
+        client = boto3.client("s3")
+        client.create_bucket(Bucket=bucket)
+        yield client
+
+
+def put(client, key, data):
+    client.put_object(Bucket=bucket, Key=key, Body=data)
+    return "s3://{}/{}".format(bucket, key)
+
+
+def get(cache, url, client, last_used):
+    # released right away, last used at last_used (the mtime of the entry)
+    with cache.get(url, client) as entry:
+        os.utime(entry.path, (last_used, last_used))
+        return entry.path
+
+
+def read(path):
+    with open(path, mode="rb") as infile:
+        return infile.read()
+
+
+def test_get_downloads_once(client, tmp_path):
+    url = put(client, "a.nc", b"a" * 1000)
+    cache = S3Cache(str(tmp_path), max_size=10000)
+    with cache.get(url, client) as entry:
+        assert read(entry.path) == b"a" * 1000
+        assert entry.path.endswith(".nc")
+    client.delete_object(Bucket=bucket, Key="a.nc")
+    put(client, "a.nc", b"a" * 1000)
+    # same ETag, read from the cache
+    with cache.get(url, client) as cached_entry:
+        assert cached_entry.path == entry.path
+    assert os.listdir(cache.temp_dir) == []
+
+
+def test_evicts_least_recently_used(client, tmp_path):
+    urls = [put(client, "{}.nc".format(key), key.encode() * 1000) for key in "abc"]
+    cache = S3Cache(str(tmp_path), max_size=2500)
+    path_a = get(cache, urls[0], client, 100)
+    path_b = get(cache, urls[1], client, 200)
+    # a is used again, b is now the least recently used
+    assert get(cache, urls[0], client, 300) == path_a
+    path_c = get(cache, urls[2], client, 400)
+    assert os.path.exists(path_a) and os.path.exists(path_c)
+    assert not os.path.exists(path_b)
+    assert sorted(os.listdir(cache.entries_dir)) == sorted([os.path.basename(path_a), os.path.basename(path_c)])
+
+
+def test_entries_in_use_are_kept(client, tmp_path):
+    urls = [put(client, "{}.nc".format(key), key.encode() * 1000) for key in "ab"]
+    cache = S3Cache(str(tmp_path), max_size=1000)
+    with cache.get(urls[0], client) as entry_a:
+        os.utime(entry_a.path, (100, 100))
+        # over the cap, a is the least recently used but still read
+        path_b = get(cache, urls[1], client, 200)
+        assert os.path.exists(entry_a.path) and os.path.exists(path_b)
+        cache.clear()
+        assert read(entry_a.path) == b"a" * 1000
+        assert not os.path.exists(path_b)
+    cache.clear()
+    assert os.listdir(cache.entries_dir) == []
+
+
+def test_changed_etag_is_a_new_entry(client, tmp_path):
+    url = put(client, "a.nc", b"old" * 100)
+    cache = S3Cache(str(tmp_path), max_size=10000)
+    with cache.get(url, client) as old_entry:
+        pass
+    put(client, "a.nc", b"new" * 100)
+    with cache.get(url, client) as new_entry:
+        assert new_entry.etag != old_entry.etag
+        assert new_entry.path != old_entry.path
+        assert read(new_entry.path) == b"new" * 100
+    # the old entry ages out
+    assert read(old_entry.path) == b"old" * 100
+
+
+def test_evict_and_clear_remove_lock_files(client, tmp_path):
+    urls = [put(client, "{}.nc".format(key), key.encode() * 1000) for key in "ab"]
+    cache = S3Cache(str(tmp_path), max_size=1500)
+    path_a = get(cache, urls[0], client, 100)
+    path_b = get(cache, urls[1], client, 200)
+    entry_lock = os.path.basename(path_a) + ".lock"
+    assert entry_lock not in os.listdir(cache.locks_dir)
+    assert os.path.basename(path_b) + ".lock" in os.listdir(cache.locks_dir)
+    cache.clear()
+    assert os.listdir(cache.entries_dir) == []
+    # only the lock of the eviction itself is left
+    assert os.listdir(cache.locks_dir) == ["evict.lock"]
@@ -0,0 +1,92 @@
+import os
+
+import pytest
+from botocore.exceptions import ClientError
+
+moto = pytest.importorskip("moto")
+import boto3
+
+from fcx_playground.fcx_dataprocess.utils.s3_io import head_s3, read_s3
+
+bucket = "fcx-test"
+
+
+@pytest.fixture
+def client(monkeypatch):
+    # a local s3 stand-in, no credentials nor network needed
+    monkeypatch.setenv("AWS_ACCESS_KEY_ID", "testing")
+    monkeypatch.setenv("AWS_SECRET_ACCESS_KEY", "testing")
+    monkeypatch.setenv("AWS_DEFAULT_REGION", "us-east-1")
+    with moto.mock_aws():
+        client = boto3.client("s3")
+        client.create_bucket(Bucket=bucket)
+        yield client
+
+
+def put(client, key, data):
+    client.put_object(Bucket=bucket, Key=key, Body=data)
+    return "s3://{}/{}".format(bucket, key)
+
+
+def test_head(client):
+    url = put(client, "head.nc", b"12345")
+    size, etag = head_s3(url, client)
+    assert size == 5
+    assert etag == client.head_object(Bucket=bucket, Key="head.nc")["ETag"]
+
+
+@pytest.mark.parametrize("part_size", [1000, 4096, 10000, 1 << 20])
+def test_multipart_read(client, part_size):
+    data = os.urandom(10000)
+    url = put(client, "data.nc", data)
+    s3_file = read_s3(url, client, part_size=part_size, workers=4)
+    assert s3_file.data == data
+    assert s3_file.size == len(data)
+    assert s3_file.path is None
+
+
+def test_spill_file(client, tmp_path):
+    data = os.urandom(10000)
+    url = put(client, "data.nc", data)
+    s3_file = read_s3(url, client, spill_dir=str(tmp_path / "spill"), part_size=3000, workers=4)
+    assert s3_file.data is None
+    assert s3_file.path.endswith(".nc")
+    with open(s3_file.path, mode="rb") as infile:
+        assert infile.read() == data
+
+
+@pytest.mark.parametrize("spill", [False, True])
+def test_empty_object(client, tmp_path, spill):
+    url = put(client, "empty.nc", b"")
+    s3_file = read_s3(url, client, spill_dir=str(tmp_path) if spill else None)
+    assert s3_file.size == 0
+    if spill:
+        assert os.path.getsize(s3_file.path) == 0
+    else:
+        assert s3_file.data == b""
+
+
+@pytest.mark.parametrize("spill", [False, True])
+def test_object_changed_between_parts(client, tmp_path, spill):
+    url = put(client, "changed.nc", b"a" * 100000)
+    get_object = client.get_object
+    calls = []
+
+    def get_object_then_change(**kwargs):
+        # the object is replaced once the first part is downloaded
+        calls.append(kwargs)
+        response = get_object(**kwargs)
+        if len(calls) == 1:
+            put(client, "changed.nc", b"b" * 100000)
+        return response
+
+    client.get_object = get_object_then_change
+    spill_dir = tmp_path / "spill"
+    with pytest.raises(ClientError) as error:
+        read_s3(url, client, spill_dir=str(spill_dir) if spill else None, part_size=1000, workers=1)
+    assert error.value.response["ResponseMetadata"]["HTTPStatusCode"] == 412
+    assert all("IfMatch" in kwargs for kwargs in calls)
+    # the failed part is not retried, and the parts not started yet are cancelled
+    assert len(calls) < 100
+    if spill:
+        assert os.listdir(str(spill_dir)) == []
@@ -0,0 +1,86 @@
+import json
+import struct
+
+import numpy as np
+import pytest
+
+from fcx_playground.fcx_dataprocess.utils.tiles_point_cloud import (
+    cartographic_to_cartesian, encodings, get_encoding, value_encoding, write_pnts)
+
+component_types = {
+    "FLOAT": np.float32,
+    "UNSIGNED_BYTE": np.uint8,
+    "UNSIGNED_SHORT": np.uint16,
+    "UNSIGNED_INT": np.uint32,
+    "SHORT": np.int16
+}
+
+
+def read_pnts(path):
+    """Returns the feature table, the batch table and the batch properties of a .pnts tile."""
+    with open(path, mode="rb") as infile:
+        data = infile.read()
+    _, _, _, feature_json_length, feature_binary_length, batch_json_length, batch_binary_length = struct.unpack("<4sIIIIII", data[:28])
+    start = 28
+    feature_table = json.loads(data[start:start + feature_json_length])
+    start += feature_json_length + feature_binary_length
+    batch_table = json.loads(data[start:start + batch_json_length])
+    batch_binary = data[start + batch_json_length:start + batch_json_length + batch_binary_length]
+    properties = {}
+    for name, batch_property in batch_table.items():
+        if name == "extras":
+            continue
+        components = 3 if batch_property["type"] == "VEC3" else 1
+        properties[name] = np.frombuffer(batch_binary, component_types[batch_property["componentType"]],
+                                         feature_table["POINTS_LENGTH"] * components, batch_property["byteOffset"])
+    return feature_table, batch_table, properties
+
+
+@pytest.fixture
+def points():
+    rng = np.random.default_rng(0)
+    size = 5000
+    lon = (-124.0 + rng.random(size) * 0.5).astype(np.float32)
+    lat = (47.0 + rng.random(size) * 0.5).astype(np.float32)
+    alt = (rng.random(size) * 19000).astype(np.float32)
+    # reflectivities, in the float32 of the zarr store
+    value = rng.normal(10, 8, size).astype(np.float32)
+    time = np.sort(rng.integers(0, 3000, size)).astype(np.int32)
+    return lon, lat, alt, value, time
+
+
+def write(path, points, encoding):
+    lon, lat, alt, value, time = points
+    cartesian, offset, scale, cartographic, _ = cartographic_to_cartesian(lon, lat, alt)
+    encoding = get_encoding(encoding)
+    write_pnts(str(path), cartesian, offset, scale, value, time, cartographic, encoding, value_encoding(value, encoding))
+    return read_pnts(str(path))
+
+
+@pytest.mark.parametrize("value_type", ["uint8", "uint16"])
+def test_quantized_values_within_half_a_step(points, tmp_path, value_type):
+    _, batch_table, properties = write(tmp_path / "0_1.pnts", points, {**encodings["compact"], "value": value_type})
+    extras = batch_table["extras"]["value"]
+    assert extras["type"] == value_type
+    decoded = properties["value"].astype(np.float64) * extras["scale"] + extras["offset"]
+    assert np.max(np.abs(decoded - points[3])) <= extras["scale"] / 2
+
+
+def test_relative_times(points, tmp_path):
+    _, batch_table, properties = write(tmp_path / "0_1.pnts", points, "compact")
+    assert properties["time"].dtype == np.uint16
+    np.testing.assert_array_equal(properties["time"].astype(np.int64) + batch_table["extras"]["time"]["offset"], points[4])
+
+
+def test_compact_encoding_attributes(points, tmp_path):
+    feature_table, batch_table, _ = write(tmp_path / "default.pnts", points, "default")
+    assert "BATCH_ID" in feature_table and "location" in batch_table
+    feature_table, batch_table, _ = write(tmp_path / "compact.pnts", points, "compact")
+    assert "BATCH_ID" not in feature_table and "location" not in batch_table
+
+
+def test_location_opt_in(points, tmp_path):
+    lon, lat, alt = points[:3]
+    _, _, properties = write(tmp_path / "0_1.pnts", points, {**encodings["compact"], "location": True})
+    _, _, _, cartographic, _ = cartographic_to_cartesian(lon, lat, alt)
+    np.testing.assert_array_equal(properties["location"], cartographic.ravel())
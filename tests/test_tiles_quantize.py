@@ -0,0 +1,173 @@
+import numpy as np
+import pytest
+
+from fcx_playground.fcx_dataprocess.utils.tiles_quantize import (
+    geodetic_to_ecef, quantize_cartographic, quantize_positions, tile_region, to_rad)
+
+# WGS84
+semi_major_axis = 6378137.0
+semi_minor_axis = 6356752.314245179
+eccentricity_squared = 6.69437999014e-3
+
+
+def reference_ecef(lon, lat, alt):
+    # textbook conversion, with the prime vertical radius of curvature
+    lon = np.asarray(lon, dtype=np.float64) * to_rad
+    lat = np.asarray(lat, dtype=np.float64) * to_rad
+    alt = np.asarray(alt, dtype=np.float64)
+    radius = semi_major_axis / np.sqrt(1 - eccentricity_squared * np.sin(lat) ** 2)
+    return np.stack([
+        (radius + alt) * np.cos(lat) * np.cos(lon),
+        (radius + alt) * np.cos(lat) * np.sin(lon),
+        (radius * (1 - eccentricity_squared) + alt) * np.sin(lat)
+    ], axis=1)
+
+
+def legacy_quantization(lon, lat, alt):
+    # tile quantization before the kernels, in the float32 of the zarr store
+    lon = lon * to_rad
+    lat = lat * to_rad
+    radii_squared = np.array([40680631590769, 40680631590769, 40408299984661.445], dtype=np.float64)
+    n1 = np.multiply(np.cos(lat), np.cos(lon))
+    n2 = np.multiply(np.cos(lat), np.sin(lon))
+    n3 = np.sin(lat)
+    magnitude = np.sqrt(np.square(n1) + np.square(n2) + np.square(n3))
+    n1, n2, n3 = n1 / magnitude, n2 / magnitude, n3 / magnitude
+    k1, k2, k3 = radii_squared[0] * n1, radii_squared[1] * n2, radii_squared[2] * n3
+    gamma = np.sqrt(np.multiply(n1, k1) + np.multiply(n2, k2) + np.multiply(n3, k3))
+    k1, k2, k3 = k1 / gamma, k2 / gamma, k3 / gamma
+    x = np.multiply(n1, alt) + k1
+    y = np.multiply(n2, alt) + k2
+    z = np.multiply(n3, alt) + k3
+    offset = [float(np.min(x)), float(np.min(y)), float(np.min(z))]
+    x, y, z = x - offset[0], y - offset[1], z - offset[2]
+    scale = [float(abs(np.max(x))), float(abs(np.max(y))), float(abs(np.max(z)))]
+    scale = [axis_scale if axis_scale > 0 else 1.0 for axis_scale in scale]
+    cartesian = np.zeros(shape=(lon.size, 3), dtype=np.uint16)
+    cartesian[:, 0] = (x / scale[0] * 65535.0).astype(np.uint16)
+    cartesian[:, 1] = (y / scale[1] * 65535.0).astype(np.uint16)
+    cartesian[:, 2] = (z / scale[2] * 65535.0).astype(np.uint16)
+    return cartesian, offset, scale
+
+
+@pytest.fixture
+def curtain():
+    # float32 points of a radar curtain, as read from the zarr store
+    rng = np.random.default_rng(0)
+    size = 10000
+    lon = (-124.0 + rng.random(size) * 1.2).astype(np.float32)
+    lat = (46.0 + rng.random(size) * 0.8).astype(np.float32)
+    alt = (rng.random(size) * 10000).astype(np.float32)
+    return lon, lat, alt
+
+
+def test_geodetic_to_ecef_known_points():
+    ecef = geodetic_to_ecef(np.array([0.0, 90.0, 0.0, 0.0]), np.array([0.0, 0.0, 90.0, -90.0]), np.array([0.0, 0.0, 0.0, 100.0]))
+    expected = [
+        [semi_major_axis, 0, 0],
+        [0, semi_major_axis, 0],
+        [0, 0, semi_minor_axis],
+        [0, 0, -semi_minor_axis - 100.0]
+    ]
+    np.testing.assert_allclose(ecef, expected, rtol=0, atol=1e-6)
+
+
+def test_geodetic_to_ecef_matches_reference(curtain):
+    lon, lat, alt = curtain
+    ecef = geodetic_to_ecef(lon, lat, alt)
+    assert ecef.dtype == np.float64
+    assert ecef.shape == (lon.size, 3)
+    np.testing.assert_allclose(ecef, reference_ecef(lon, lat, alt), rtol=0, atol=1e-6)
+
+
+@pytest.mark.parametrize("chunk", [1, 7, 4096, 9999, 10000, 10001])
+def test_geodetic_to_ecef_chunks(curtain, chunk):
+    # chunk boundaries do not change the result
+    lon, lat, alt = curtain
+    np.testing.assert_array_equal(geodetic_to_ecef(lon, lat, alt, chunk=chunk), geodetic_to_ecef(lon, lat, alt))
+
+
+def test_geodetic_to_ecef_out(curtain):
+    lon, lat, alt = curtain
+    out = np.full((lon.size, 3), np.nan, dtype=np.float32)
+    ecef = geodetic_to_ecef(lon, lat, alt, out=out, chunk=1000)
+    assert ecef is out
+    np.testing.assert_array_equal(out, geodetic_to_ecef(lon, lat, alt, dtype=np.float32))
+
+
+def test_geodetic_to_ecef_empty():
+    empty = np.zeros(0, dtype=np.float32)
+    assert geodetic_to_ecef(empty, empty, empty).shape == (0, 3)
+
+
+def test_quantize_positions_endpoints(curtain):
+    positions = geodetic_to_ecef(*curtain)
+    quantized, offset, scale = quantize_positions(positions)
+    assert quantized.dtype == np.uint16
+    np.testing.assert_array_equal(quantized[np.argmin(positions, axis=0), [0, 1, 2]], [0, 0, 0])
+    np.testing.assert_array_equal(quantized[np.argmax(positions, axis=0), [0, 1, 2]], [65535, 65535, 65535])
+    np.testing.assert_array_equal(offset, np.min(positions, axis=0))
+    np.testing.assert_array_equal(scale, np.max(positions, axis=0) - np.min(positions, axis=0))
+    # dequantized within one step
+    dequantized = quantized / 65535.0 * np.array(scale) + np.array(offset)
+    assert np.all(np.abs(dequantized - positions) <= np.array(scale) / 65535.0)
+
+
+def test_quantize_positions_chunks(curtain):
+    positions = geodetic_to_ecef(*curtain)
+    out = np.empty((positions.shape[0], 3), dtype=np.uint16)
+    quantized, _, _ = quantize_positions(positions, out=out, chunk=333)
+    assert quantized is out
+    np.testing.assert_array_equal(quantized, quantize_positions(positions)[0])
+
+
+def test_quantize_positions_flat_axis():
+    positions = np.array([[1.0, 5.0, 2.0], [3.0, 5.0, 4.0], [2.0, 5.0, 3.0]])
+    quantized, offset, scale = quantize_positions(positions)
+    assert offset == [1.0, 5.0, 2.0]
+    assert scale == [2.0, 1.0, 2.0]
+    np.testing.assert_array_equal(quantized[:, 1], 0)
+    np.testing.assert_array_equal(quantized[:, 0], [0, 65535, 32767])
+
+
+def test_quantize_positions_single_point():
+    quantized, offset, scale = quantize_positions(np.array([[-2.5e6, -3.8e6, 4.5e6]]))
+    np.testing.assert_array_equal(quantized, [[0, 0, 0]])
+    assert offset == [-2.5e6, -3.8e6, 4.5e6]
+    assert scale == [1.0, 1.0, 1.0]
+
+
+def test_quantize_cartographic():
+    cartographic = quantize_cartographic(
+        np.array([180.0, -180.0, 0.0, -123.4], dtype=np.float32),
+        np.array([90.0, -90.0, 0.0, 47.2], dtype=np.float32),
+        np.array([0.0, 12345.0, -9.0, 19999.0], dtype=np.float32))
+    assert cartographic.dtype == np.int16
+    # truncated toward zero
+    np.testing.assert_array_equal(cartographic, [
+        [32767, 16383, 0],
+        [-32767, -16383, 1234],
+        [0, 0, 0],
+        [int(-123.4 * 32767 / 180), int(47.2 * 32767 / 180), 1999]
+    ])
+
+
+def test_tile_region(curtain):
+    lon, lat, alt = curtain
+    region = tile_region(lon, lat, alt)
+    assert all(isinstance(bound, float) for bound in region)
+    np.testing.assert_allclose(region[:4], np.array([lon.min(), lat.min(), lon.max(), lat.max()], dtype=np.float64) * to_rad, rtol=1e-6)
+    assert region[4:] == [float(alt.min()), float(alt.max())]
+    assert region[0] <= region[2] and region[1] <= region[3]
+
+
+@pytest.mark.skipif(np.lib.NumpyVersion(np.__version__) >= "2.0.0",
+                    reason="the legacy quantization relied on the value based casting of numpy 1")
+def test_float32_matches_legacy_quantization(curtain):
+    # with dtype float32, the kernels give the tiles of the previous implementation, byte for byte
+    lon, lat, alt = curtain
+    quantized, offset, scale = quantize_positions(geodetic_to_ecef(lon, lat, alt, dtype=np.float32, chunk=4096))
+    legacy_cartesian, legacy_offset, legacy_scale = legacy_quantization(lon, lat, alt)
+    assert quantized.tobytes() == legacy_cartesian.tobytes()
+    assert offset == legacy_offset
+    assert scale == legacy_scale
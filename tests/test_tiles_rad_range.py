@@ -0,0 +1,33 @@
+import numpy as np
+import pytest
+import xarray as xr
+
+from fcx_playground.fcx_dataprocess import tiles_rad_range
+from fcx_playground.fcx_dataprocess.tiles_rad_range import RadRangeTilesPointCloudDataProcess
+
+
+def test_dask_chunks_without_dask(monkeypatch):
+    monkeypatch.setattr(tiles_rad_range, "dask", None)
+    with pytest.raises(ValueError, match="dask"):
+        RadRangeTilesPointCloudDataProcess(dask_chunks=1000)
+    # without dask_chunks, dask is not needed
+    RadRangeTilesPointCloudDataProcess()
+
+
+def test_zarr_path_per_profile_range():
+    data_process = RadRangeTilesPointCloudDataProcess(profile_range=(0, 10000))
+    data_process.url = "s3://bucket/olympex_CRS_20151110_223000-253000_v01.nc"
+    other = RadRangeTilesPointCloudDataProcess(profile_range=(10000, 20000))
+    other.url = data_process.url
+    assert data_process._get_zarr_path().endswith("olympex_CRS_20151110_223000-253000_v01/zarr_profiles_0_10000")
+    assert data_process._get_zarr_path() != other._get_zarr_path()
+
+
+def test_profile_time_over_midnight():
+    # the hours of the file go from 23.5 to 0.5, the profiles after midnight are on the next day
+    data_process = RadRangeTilesPointCloudDataProcess()
+    data_process.url = "olympex_CRS_20151110_223000-253000_v01.nc"
+    data = xr.Dataset({"timed": ("profile", np.array([23.5, 23.75, 23.99, 0.0, 0.25, 0.5]))})
+    time = data_process._get_profile_time(data)
+    midnight = 1447200000
+    np.testing.assert_array_equal(time, [midnight - 1800, midnight - 900, midnight - 36, midnight, midnight + 900, midnight + 1800])
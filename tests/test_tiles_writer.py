@@ -0,0 +1,78 @@
+import gzip
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from fcx_playground.fcx_dataprocess.tiles_rad_range import RadRangeTilesPointCloudDataProcess
+from fcx_playground.fcx_dataprocess.utils.manifest import Manifest
+from fcx_playground.fcx_dataprocess.utils.tiles_writer import tiles_manifest_path, write_tiles
+
+epoch = 1447194600
+
+
+@pytest.fixture(scope="module")
+def zarr_path(tmp_path_factory):
+    # a short radar curtain, 20 profiles of 100 gates
+    rng = np.random.default_rng(0)
+    num_profiles, num_gates = 20, 100
+    data = pd.DataFrame({
+        "time": np.repeat(epoch + np.arange(num_profiles, dtype=np.int64), num_gates),
+        "lon": np.repeat(-124.0 + np.arange(num_profiles) * 0.002, num_gates),
+        "lat": np.repeat(47.0 + np.arange(num_profiles) * 0.001, num_gates),
+        "alt": np.tile(19000 - np.arange(num_gates) * 26.0, num_profiles),
+        "ref": rng.normal(10, 8, num_profiles * num_gates)
+    })
+    data_process = RadRangeTilesPointCloudDataProcess()
+    zarr_path = str(tmp_path_factory.mktemp("store") / "zarr")
+    root = data_process._create_zarr_store(zarr_path, data.shape[0])
+    data_process._write_to_zarr(root, data_process._get_zarr_columns(data, epoch), 0)
+    data_process._finalize_zarr(root, epoch)
+    return zarr_path
+
+
+def sidecars(folder):
+    return sorted(filename for filename in os.listdir(folder) if filename.endswith(".gz"))
+
+
+def assert_sidecars_match(folder):
+    for filename in sidecars(folder):
+        with open(os.path.join(folder, filename[:-3]), mode="rb") as infile:
+            raw = infile.read()
+        with gzip.open(os.path.join(folder, filename)) as infile:
+            assert infile.read() == raw, filename
+
+
+def test_rerun_without_compression_removes_sidecars(zarr_path, tmp_path):
+    folder = str(tmp_path / "point_cloud")
+    write_tiles("ref", epoch, epoch + 100, zarr_path, folder, compress="gzip")
+    assert "0_1.pnts.gz" in sidecars(folder) and "tileset.json.gz" in sidecars(folder)
+    assert_sidecars_match(folder)
+
+    # the tiles are generated again, and their previous sidecars would be served instead
+    write_tiles("ref", epoch, epoch + 100, zarr_path, folder, refine="ADD")
+    assert sidecars(folder) == []
+    assert not any(name.startswith("sidecar/") for name in Manifest(tiles_manifest_path(folder)).entries)
+
+
+def test_rerun_recompresses_rewritten_tiles(zarr_path, tmp_path):
+    folder = str(tmp_path / "point_cloud")
+    write_tiles("ref", epoch, epoch + 100, zarr_path, folder, compress="gzip")
+    previous = sidecars(folder)
+    write_tiles("ref", epoch, epoch + 100, zarr_path, folder, refine="ADD", compress="gzip")
+    assert sidecars(folder) == previous
+    assert_sidecars_match(folder)
+
+
+def test_rerun_without_compression_after_compressed_only_tiles(zarr_path, tmp_path):
+    folder = str(tmp_path / "point_cloud")
+    write_tiles("ref", epoch, epoch + 100, zarr_path, folder, compress="gzip", keep_raw=False)
+    assert not os.path.exists(os.path.join(folder, "0_1.pnts"))
+    write_tiles("ref", epoch, epoch + 100, zarr_path, folder, compress="gzip", keep_raw=False)
+    assert "0_1.pnts.gz" in sidecars(folder)
+
+    # the raw tiles are generated again, without the sidecars
+    write_tiles("ref", epoch, epoch + 100, zarr_path, folder)
+    assert os.path.exists(os.path.join(folder, "0_1.pnts"))
+    assert sidecars(folder) == []
@@ -0,0 +1,95 @@
+import numpy as np
+import pytest
+
+from fcx_playground.fcx_dataprocess.utils.tiles_quantize import geodetic_to_ecef
+from fcx_playground.fcx_dataprocess.utils.trajectory import simplify_trajectory
+
+
+@pytest.fixture
+def track():
+    # a noisy flight track, one sample per second, with turns
+    rng = np.random.default_rng(0)
+    size = 5000
+    time = np.arange(size, dtype=np.float64)
+    heading = np.cumsum(rng.normal(0, 0.01, size))
+    longitude = -124.0 + np.cumsum(np.cos(heading)) * 0.002
+    latitude = 47.0 + np.cumsum(np.sin(heading)) * 0.002
+    altitude = 19000 + np.cumsum(rng.normal(0, 2, size))
+    roll = rng.normal(0, 0.01, size)
+    return time, longitude, latitude, altitude, [roll, heading]
+
+
+def brute_force_errors(keep, time, longitude, latitude, altitude, angles):
+    """Returns the position and angle errors of every sample, against the interpolation between the kept samples around it."""
+    kept = np.nonzero(keep)[0]
+    position = geodetic_to_ecef(longitude, latitude, altitude)
+    position_error = np.zeros(time.size)
+    angle_error = np.zeros(time.size)
+    for first, last in zip(kept[:-1], kept[1:]):
+        for sample in range(first + 1, last):
+            fraction = (time[sample] - time[first]) / (time[last] - time[first])
+            interpolated = position[first] + fraction * (position[last] - position[first])
+            position_error[sample] = np.linalg.norm(position[sample] - interpolated)
+            for angle in angles:
+                interpolated = angle[first] + fraction * (angle[last] - angle[first])
+                angle_error[sample] = max(angle_error[sample], abs(angle[sample] - interpolated))
+    return position_error, angle_error
+
+
+@pytest.mark.parametrize("position_tolerance, angle_tolerance, window", [
+    (10.0, np.pi / 180, 4096),
+    (1.0, np.pi / 1800, 4096),
+    (50.0, np.pi / 18, 100),
+    (10.0, np.pi / 180, 3),
+])
+def test_dropped_samples_within_tolerances(track, position_tolerance, angle_tolerance, window):
+    time, longitude, latitude, altitude, angles = track
+    keep = simplify_trajectory(time, longitude, latitude, altitude, angles, position_tolerance, angle_tolerance, window)
+    assert keep.dtype == bool and keep.shape == time.shape
+    assert keep[0] and keep[-1]
+    assert np.all(keep[::window])
+    assert np.count_nonzero(keep) < time.size
+    position_error, angle_error = brute_force_errors(keep, time, longitude, latitude, altitude, angles)
+    assert np.max(position_error) <= position_tolerance * (1 + 1e-9)
+    assert np.max(angle_error) <= angle_tolerance * (1 + 1e-9)
+
+
+def test_tighter_tolerances_keep_more(track):
+    time, longitude, latitude, altitude, angles = track
+    coarse = simplify_trajectory(time, longitude, latitude, altitude, angles, 50.0, np.pi / 18)
+    fine = simplify_trajectory(time, longitude, latitude, altitude, angles, 1.0, np.pi / 1800)
+    assert np.count_nonzero(coarse) < np.count_nonzero(fine)
+
+
+def test_uniform_motion_keeps_the_ends():
+    # constant speed along the equator at a constant altitude: not a straight line in 3d, but within 10 m over 0.01 degrees
+    time = np.arange(100, dtype=np.float64)
+    longitude = np.linspace(0, 0.01, 100)
+    keep = simplify_trajectory(time, longitude, np.zeros(100), np.full(100, 10000.0))
+    np.testing.assert_array_equal(np.nonzero(keep)[0], [0, 99])
+
+
+def test_irregular_times():
+    # the position is interpolated in time, not in samples: a stop along a straight segment is kept
+    time = np.array([0.0, 1.0, 2.0, 100.0, 101.0])
+    longitude = np.array([0.0, 0.001, 0.002, 0.003, 0.004])
+    keep = simplify_trajectory(time, longitude, np.zeros(5), np.zeros(5), position_tolerance=1.0)
+    assert keep[0] and keep[-1]
+    assert np.count_nonzero(keep) > 2
+    position_error, _ = brute_force_errors(keep, time, longitude, np.zeros(5), np.zeros(5), [])
+    assert np.max(position_error) <= 1.0
+
+
+@pytest.mark.parametrize("size", [0, 1, 2])
+def test_short_tracks(size):
+    samples = np.arange(size, dtype=np.float64)
+    keep = simplify_trajectory(samples, samples * 0.01, samples * 0.01, samples * 100)
+    assert keep.shape == (size,)
+    assert np.all(keep)
+
+
+@pytest.mark.parametrize("position_tolerance, angle_tolerance", [(0.0, 1.0), (-1.0, 1.0), (1.0, 0.0), (1.0, np.nan)])
+def test_invalid_tolerances(position_tolerance, angle_tolerance):
+    samples = np.arange(10, dtype=np.float64)
+    with pytest.raises(ValueError):
+        simplify_trajectory(samples, samples, samples, samples, (), position_tolerance, angle_tolerance)
@@ -0,0 +1,134 @@
+import numpy as np
+import pandas as pd
+import pytest
+import zarr
+
+from fcx_playground.fcx_dataprocess.tiles_rad_range import RadRangeTilesPointCloudDataProcess
+from fcx_playground.fcx_dataprocess.utils.zarr_index import TimeIndex, build_time_index, query_region
+from fcx_playground.fcx_dataprocess.utils.zarr_storage import read_location
+
+# 2015-11-10 23:57:30 UTC, the flight goes over midnight
+epoch = 1447199850
+chunk = 1000
+
+
+def synthetic_points(seed=0):
+    # profiles of up to 37 gates, one every 0 to 3 seconds (repeated times and gaps), with some missing gates
+    rng = np.random.default_rng(seed)
+    num_profiles, num_gates = 300, 37
+    profile_time = epoch + np.cumsum(rng.integers(0, 4, num_profiles))
+    # a gap of 10 minutes
+    profile_time[200:] += 600
+    keep = rng.random(num_profiles * num_gates) > 0.2
+    return pd.DataFrame({
+        "time": np.repeat(profile_time, num_gates)[keep],
+        "lon": np.repeat(-124.0 + np.cumsum(rng.random(num_profiles)) * 0.01, num_gates)[keep],
+        "lat": np.repeat(47.0 + np.cumsum(rng.random(num_profiles)) * 0.01, num_gates)[keep],
+        "alt": np.tile(19000 - np.arange(num_gates) * 500.0, num_profiles)[keep],
+        "ref": rng.normal(10, 8, num_profiles * num_gates)[keep]
+    })
+
+
+@pytest.fixture(scope="module", params=["default", "small-on-disk"])
+def store(request, tmp_path_factory):
+    # interleaved location, and columnar location with delta encoded time, in small chunks
+    data = synthetic_points()
+    data_process = RadRangeTilesPointCloudDataProcess(storage=request.param)
+    data_process.storage["chunk"] = chunk
+    data_process.chunk = chunk
+    zarr_path = str(tmp_path_factory.mktemp(request.param) / "zarr")
+    root = data_process._create_zarr_store(zarr_path, data.shape[0])
+    data_process._write_to_zarr(root, data_process._get_zarr_columns(data, epoch), 0)
+    data_process._finalize_zarr(root, epoch)
+    return zarr.open_group(zarr_path, mode="r")
+
+
+def windows(time):
+    """Returns time windows, unix time, at the boundary cases of a sorted time array (relative to epoch)."""
+    cases = [
+        (epoch - 100, epoch - 1),                   # before the points
+        (epoch + time[-1] + 1, epoch + time[-1] + 100),  # after the points
+        (epoch - 100, epoch + time[-1] + 100),      # every point
+        (epoch + 10, epoch + 5),                    # end before epoch
+        (epoch + time[0], epoch + time[0]),         # first second
+        (epoch + time[-1], epoch + time[-1]),       # last second
+        (1447200000 - 30, 1447200000 + 30),         # midnight
+    ]
+    # inside the gap
+    gap = int(np.argmax(np.diff(time)))
+    cases.append((epoch + time[gap] + 1, epoch + time[gap + 1] - 1))
+    # starting or ending at the chunk edges
+    for edge in range(chunk, time.size, chunk):
+        for offset in [-1, 0, 1]:
+            cases.append((epoch + time[edge] + offset, epoch + time[-1]))
+            cases.append((epoch + time[0], epoch + time[edge] + offset))
+            cases.append((epoch + time[edge - 1] + offset, epoch + time[edge] + offset))
+    return cases
+
+
+@pytest.mark.parametrize("stride", [None, 64, 4096])
+def test_time_index_matches_searchsorted(store, stride, tmp_path):
+    time = store["time"][:].astype(np.int64)
+    root = store
+    if stride is not None:
+        # the index of the store with another stride (larger than a chunk with 4096)
+        root = zarr.group(zarr.DirectoryStore(str(tmp_path / "zarr")))
+        zarr.copy_all(store, root)
+        build_time_index(root, stride)
+    index = TimeIndex(root)
+    if stride is not None:
+        assert index.stride == stride
+
+    values = np.unique(np.concatenate([time - 1, time, time + 1, [time[0] - 100, time[-1] + 100]]))
+    for side in ["left", "right"]:
+        for value in values:
+            assert index.search(value, side) == np.searchsorted(time, value, side), (value, side)
+
+    for window_epoch, window_end in windows(time):
+        start = int(np.searchsorted(time, window_epoch - epoch, "left"))
+        stop = int(np.searchsorted(time, window_end - epoch, "right"))
+        assert index.query(window_epoch, window_end) == (start, max(start, stop)), (window_epoch, window_end)
+
+
+def test_time_index_without_index(store, tmp_path):
+    # stores written before the index, indexed in memory
+    root = zarr.group(zarr.DirectoryStore(str(tmp_path / "zarr")))
+    zarr.copy_all(store, root)
+    del root["index"]
+    time = root["time"][:].astype(np.int64)
+    for window_epoch, window_end in windows(time):
+        assert TimeIndex(root).query(window_epoch, window_end) == TimeIndex(store).query(window_epoch, window_end)
+
+
+def brute_force_region(points, bbox, window_epoch=None, window_end=None):
+    lon, lat, alt, value, time = points
+    mask = np.ones(time.size, dtype=bool)
+    for column, lower, upper in zip([lon, lat, alt], bbox[:3], bbox[3:]):
+        mask &= (column >= lower) & (column <= upper)
+    if window_epoch is not None:
+        mask &= (time.astype(np.int64) + epoch >= window_epoch) & (time.astype(np.int64) + epoch <= window_end)
+    return lon[mask], lat[mask], alt[mask], value[mask], time[mask]
+
+
+def test_query_region_matches_brute_force(store):
+    lon, lat, alt = read_location(store)
+    points = (lon, lat, alt, store["value"]["ref"][:], store["time"][:])
+    time = store["time"][:].astype(np.int64)
+    middle = [float(np.median(lon)), float(np.median(lat))]
+    bboxes = [
+        [-180, -90, -1000, 180, 90, 100000],                                # every point
+        [0, 0, 0, 1, 1, 1],                                                 # no point
+        [-180, -90, 19000, 180, 90, 19000],                                 # the top gates only, bounds included
+        [-180, -90, -1000, middle[0], 90, 100000],                          # half of the track
+        [middle[0] - 0.2, middle[1] - 0.2, 5000, middle[0] + 0.2, middle[1] + 0.2, 15000],
+        # the bounding box of a chunk
+        [float(np.min(lon[chunk:2 * chunk])), float(np.min(lat[chunk:2 * chunk])), float(np.min(alt[chunk:2 * chunk])),
+         float(np.max(lon[chunk:2 * chunk])), float(np.max(lat[chunk:2 * chunk])), float(np.max(alt[chunk:2 * chunk]))],
+    ]
+    for bbox in bboxes:
+        for window in [(None, None)] + windows(time):
+            result = query_region(store, "ref", bbox, *window)
+            expected = brute_force_region(points, bbox, *window)
+            for column, expected_column in zip(result, expected):
+                np.testing.assert_array_equal(column, expected_column, err_msg="{} {}".format(bbox, window))
+                assert column.dtype == expected_column.dtype